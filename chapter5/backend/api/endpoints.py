@@ -1,20 +1,40 @@
 """API endpoints for the TTRPG GM Assistant."""
 import asyncio
 import json
-from fastapi import APIRouter
-from pydantic import BaseModel
-from typing import Iterable, Any
+import os
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Any, Optional
 from google.genai import types
 
-from backend.database.database import add_message_to_db, get_messages_from_db
+from backend.database.async_database import check_health, get_messages
+from backend.database.history_cache import history_cache
+from backend.database.writer import message_writer
+from backend.prompts import FINAL_ANSWER_INSTRUCTION, TURN_TIMEOUT_MESSAGE
+from backend.rag.embedding_cache import embedding_cache
 from backend.rag.rag import ask_rag_question
-from backend.services.dice_roller import roll_dice_sync
+from backend.rag.semantic_cache import lore_answer_cache
+from backend.services.dice_distribution import dice_distribution_sync
+from backend.services.dice_roller import DICE_MAX_BULK_ROLLS, roll_dice_many_sync, roll_dice_sync
 from backend.services.encounter_generator import generate_encounter_details
-from backend.services.llm import client, CHAT_MODEL
+from backend.services.history_window import build_history
+from backend.services.intent_router import Route, intent_router
+from backend.services.llm import aclient, scheduler, CHAT_MODEL
 from backend.services.npc_generator import generate_npc_details
+from backend.services.response_cache import response_cache
+from backend.services.scheduler import batch_priority
+from backend.services.single_flight import single_flight
+from backend.services.turn_budget import TurnBudget, TOOL_TIMEOUT_SECONDS
 
 router = APIRouter()
 
+# How many tool calls from one model turn may run at the same time
+TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", "4"))
+# How many items of a batch generation request are generated at the same time
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+MAX_BATCH_ITEMS = 100
+
 # --- Pydantic Models ---
 class ChatRequest(BaseModel):
     prompt: str
@@ -23,6 +43,34 @@ class ChatRequest(BaseModel):
 class ToolRequest(BaseModel):
     prompt: str
 
+class GenerationRequest(ToolRequest):
+    # Skip the response cache to get a new variation
+    fresh: bool = False
+
+class LabelledRoll(BaseModel):
+    label: str
+    expression: str
+
+class BulkRollRequest(BaseModel):
+    # Either labelled rolls, or one expression rolled `count` times
+    rolls: list[LabelledRoll] = Field(default_factory=list, max_length=DICE_MAX_BULK_ROLLS)
+    expression: Optional[str] = None
+    count: int = Field(1, ge=1, le=DICE_MAX_BULK_ROLLS)
+    # Optional total to reach, e.g. the target's AC
+    target: Optional[int] = None
+
+class DiceDistributionRequest(BaseModel):
+    expression: str
+    # Optional total to reach, e.g. a DC or an AC
+    target: Optional[int] = None
+
+class BatchGenerationRequest(BaseModel):
+    # Either a list of prompts, or one prompt generated `count` times
+    prompts: list[str] = Field(default_factory=list, max_length=MAX_BATCH_ITEMS)
+    prompt: Optional[str] = None
+    count: int = Field(1, ge=1, le=MAX_BATCH_ITEMS)
+    fresh: bool = False
+
 # --- Helper Functions ---
 def parts_to_dict(parts: Iterable[Any]) -> list[dict]:
     """Converts a list of Gemini Parts to a JSON-serializable list of dictionaries."""
@@ -53,22 +101,122 @@ def normalize_tool_output(output: Any) -> dict:
     return {"output": output}
 
 
-def filter_history_for_api(messages: list[dict]) -> list[dict]:
-    """Filters persisted messages to only API-acceptable parts (text, functionResponse)."""
-    safe_history: list[dict] = []
-    for msg in messages:
-        role = msg.get("role")
-        safe_parts: list[dict] = []
-        for part in msg.get("parts", []):
-            if "text" in part:
-                safe_parts.append({"text": part["text"]})
-            elif "functionResponse" in part:
-                # pass-through (already serializable)
-                safe_parts.append(part)
-            # intentionally skip functionCall objects
-        if safe_parts:
-            safe_history.append({"role": role, "parts": safe_parts})
-    return safe_history
+async def run_tool(function_name: str, function_args: dict, budget: Optional[TurnBudget] = None) -> dict:
+    """
+    Runs one tool call with a timeout; failures are returned as an error payload for the model.
+
+    With a turn budget, the timeout is the tool's own limit cut short before the time the turn
+    reserves for its final answer, and the call, its timeout or its failure is counted in the budget.
+    """
+    timeout = budget.tool_timeout(function_name) if budget else TOOL_TIMEOUT_SECONDS
+    if budget:
+        budget.tool_calls += 1
+    function_to_call = tool_functions.get(function_name)
+    if function_to_call is None:
+        if budget:
+            budget.tool_errors += 1
+        return {"error": f"Unknown tool: {function_name}"}
+    try:
+        # Await coroutines, run sync functions in a thread
+        if asyncio.iscoroutinefunction(function_to_call):
+            call = function_to_call(**function_args)
+        else:
+            call = asyncio.to_thread(function_to_call, **function_args)
+        return normalize_tool_output(await asyncio.wait_for(call, timeout=timeout))
+    except asyncio.TimeoutError:
+        if budget:
+            budget.tool_timeouts += 1
+        return {"error": f"{function_name} timed out after {timeout:g}s"}
+    except Exception as e:
+        print(f"Error running tool {function_name}: {e}")
+        if budget:
+            budget.tool_errors += 1
+        return {"error": f"{function_name} failed: {e}"}
+
+
+async def iter_function_calls(
+    function_calls: list, budget: Optional[TurnBudget] = None
+) -> AsyncIterator[tuple[int, types.Part]]:
+    """
+    Runs the function calls of one model turn concurrently, yielding `(index, response part)` as each finishes.
+
+    At most `TOOL_CONCURRENCY` tools run at once, each under its own timeout,
+    and a failing tool only produces an error response.
+    """
+    semaphore = asyncio.Semaphore(TOOL_CONCURRENCY)
+
+    async def bounded(index: int, fc) -> tuple[int, types.Part]:
+        async with semaphore:
+            output = await run_tool(fc.name, dict(fc.args or {}), budget)
+        return index, types.Part.from_function_response(name=fc.name, response=output)
+
+    tasks = [asyncio.create_task(bounded(i, fc)) for i, fc in enumerate(function_calls)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def merge_streamed_parts(parts: list) -> list:
+    """Joins consecutive text deltas of a streamed response back into whole text parts."""
+    merged: list = []
+    for part in parts:
+        if getattr(part, "text", None) and merged and getattr(merged[-1], "text", None):
+            merged[-1] = types.Part(text=merged[-1].text + part.text)
+        else:
+            merged.append(part)
+    return merged
+
+
+def batch_items(request: BatchGenerationRequest) -> list[tuple[str, bool]]:
+    """Expands a batch request into `(prompt, fresh)` items."""
+    if request.prompts:
+        return [(prompt, request.fresh) for prompt in request.prompts]
+    if request.prompt:
+        # Repeats of the same prompt must be new variations, not copies of the first one
+        return [(request.prompt, request.fresh or i > 0) for i in range(request.count)]
+    raise HTTPException(status_code=422, detail="Provide either 'prompts' or 'prompt'.")
+
+
+async def stream_batch(
+    items: list[tuple[str, bool]],
+    generate: Callable[..., Awaitable[dict]],
+) -> AsyncIterator[str]:
+    """
+    Generates every item with bounded concurrency, yielding one NDJSON line per item as it finishes.
+
+    Each line carries the item's `index` in the request; a failed item has an "error" instead of a
+    "result", and never stops the rest of the batch.
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def generate_item(index: int, prompt: str, fresh: bool) -> dict:
+        async with semaphore:
+            try:
+                # Interactive chat requests are served before batch items when Gemini is busy
+                with batch_priority():
+                    result = await generate(prompt, fresh=fresh)
+            except Exception as e:
+                return {"index": index, "prompt": prompt, "error": str(e)}
+        if "error" in result:
+            return {"index": index, "prompt": prompt, "error": result["error"]}
+        return {"index": index, "prompt": prompt, "result": result}
+
+    tasks = [asyncio.create_task(generate_item(i, prompt, fresh)) for i, (prompt, fresh) in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield json.dumps(await next_done) + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def format_sse(event: dict) -> str:
+    """Formats an agent event as a Server-Sent Event."""
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
 
 # --- Agent and Tool Definitions ---
 # See: https://ai.google.dev/gemini-api/docs/function-calling
@@ -79,7 +227,13 @@ tools = types.Tool(
             "description": "Generates a non-player character (NPC). Input should be a descriptive prompt.",
             "parameters": {
                 "type": "object",
-                "properties": {"prompt": {"type": "string"}},
+                "properties": {
+                    "prompt": {"type": "string"},
+                    "fresh": {
+                        "type": "boolean",
+                        "description": "Set to true to get a new variation instead of a previously generated one.",
+                    },
+                },
                 "required": ["prompt"],
             },
         },
@@ -88,7 +242,13 @@ tools = types.Tool(
             "description": "Generates a combat encounter. Input should be a descriptive prompt.",
             "parameters": {
                 "type": "object",
-                "properties": {"prompt": {"type": "string"}},
+                "properties": {
+                    "prompt": {"type": "string"},
+                    "fresh": {
+                        "type": "boolean",
+                        "description": "Set to true to get a new variation instead of a previously generated one.",
+                    },
+                },
                 "required": ["prompt"],
             },
         },
@@ -101,6 +261,46 @@ tools = types.Tool(
                 "required": ["dice_string"],
             },
         },
+        {
+            "name": "roll_dice_many",
+            "description": (
+                "Rolls many dice expressions in one call, e.g. initiative for every monster or a volley of "
+                "minion attacks. Give either labelled rolls or one expression and a count. Returns each total, "
+                "the initiative order and, with a target AC or DC, the number of hits."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "rolls": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {"label": {"type": "string"}, "expression": {"type": "string"}},
+                            "required": ["label", "expression"],
+                        },
+                    },
+                    "expression": {"type": "string"},
+                    "count": {"type": "integer"},
+                    "target": {"type": "integer", "description": "AC or DC to reach."},
+                },
+            },
+        },
+        {
+            "name": "dice_distribution",
+            "description": (
+                "Computes the exact odds of a dice expression: mean, variance, percentiles and, with a target, "
+                "the probability of rolling at least the target (e.g. '1d20+5 adv' against DC 15, or '8d6' damage). "
+                "Use this instead of estimating probabilities or rolling repeatedly."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "expression": {"type": "string"},
+                    "target": {"type": "integer", "description": "Total to reach, such as a DC or an AC."},
+                },
+                "required": ["expression"],
+            },
+        },
         {
             "name": "ask_lore_keeper",
             "description": "Answers questions about campaign lore. Input should be the user's question.",
@@ -117,108 +317,274 @@ tool_functions = {
     "generate_npc": generate_npc_details,
     "generate_encounter": generate_encounter_details,
     "roll_dice": roll_dice_sync,
+    "roll_dice_many": roll_dice_many_sync,
+    "dice_distribution": dice_distribution_sync,
     "ask_lore_keeper": ask_rag_question,
 }
 
-# --- API Endpoints ---
-@router.post("/chat")
-async def chat(request: ChatRequest):
-    """The main agent endpoint with a multi-step reasoning loop."""
-    # We will use the shared client and specify tools in the config
-
-    # Start from persisted history, but only keep API-acceptable parts
-    history = filter_history_for_api(get_messages_from_db(request.thread_id))
-    user_message = {"role": "user", "parts": [{"text": request.prompt}]}
-    add_message_to_db(request.thread_id, user_message)
-    history.append(user_message)
-
-    # --- Core Agent Loop ---
-    # This loop allows the model to make multiple tool calls to fulfill a request.
-    # See: https://ai.google.dev/gemini-api/docs/thinking
-    while True:
-        response = client.models.generate_content(
-            model=CHAT_MODEL,
-            contents=history,
-            config=types.GenerateContentConfig(tools=[tools]),
+# --- Agent Loop ---
+async def answer_locally(thread_id: str, prompt: str, route: Route, output: dict) -> AsyncIterator[dict]:
+    """
+    Persists a turn answered by the fast path, in the same messages a model turn would have produced.
+
+    The user prompt, the tool call, its response and a text answer are stored, so the history,
+    the summariser and the UI cannot tell the difference; the final message's `meta` names the rule.
+    """
+    text = output["output"] if isinstance(output.get("output"), str) else json.dumps(output)
+    try:
+        await message_writer.add(thread_id, {"role": "user", "parts": [{"text": prompt}]})
+        await message_writer.add(
+            thread_id, {"role": "model", "parts": [{"functionCall": {"name": route.tool, "args": route.args}}]}
         )
+        await message_writer.add(
+            thread_id, {"role": "user", "parts": [{"functionResponse": {"name": route.tool, "response": output}}]}
+        )
+        await message_writer.add(
+            thread_id, {"role": "model", "parts": [{"text": text}], "meta": {"fast_path": route.rule}}
+        )
+    finally:
+        await message_writer.end_turn(thread_id)
+
+    yield {"type": "tool_call", "name": route.tool, "args": route.args}
+    yield {"type": "tool_result", "name": route.tool, "response": output}
+    yield {"type": "text", "text": text}
+    yield {"type": "done", "fast_path": route.rule}
+
+
+async def run_agent_turn(thread_id: str, prompt: str) -> AsyncIterator[dict]:
+    """
+    Runs one turn of the multi-step reasoning loop, yielding events as they happen.
+
+    Events are dicts with a "type" of "text" (a streamed text delta), "reset" (discard the
+    text streamed since the last tool activity), "tool_call", "tool_result" or "done".
+    The same messages are persisted as in a non-streamed turn.
+
+    The turn runs under a `TurnBudget`: once it has used its model iterations or reached the
+    time reserved for the final answer, the model is called one last time with tools disabled
+    and must answer. Every model call is cut off at the turn's deadline. What the
+    turn used is stored in the `meta` of its final message and sent with the "done" event.
+
+    Messages matched by the `intent_router` are answered by calling their tool directly.
+    """
+    # Trivial requests (a bare dice roll, a lore question answered before) skip the model entirely
+    route = intent_router.route(prompt)
+    if route is not None:
+        output = await run_tool(route.tool, route.args)
+        if "error" not in output:
+            async for event in answer_locally(thread_id, prompt, route, output):
+                yield event
+            return
+        intent_router.fall_back(route)
+
+    budget = TurnBudget()
+
+    # Make sure earlier writes to this thread are visible before reading it back
+    await message_writer.flush(thread_id)
+
+    # Start from the summarised, token-budgeted window of the persisted history
+    history = await build_history(thread_id)
+    user_message = {"role": "user", "parts": [{"text": prompt}]}
+    await message_writer.add(thread_id, user_message)
+    history.append(user_message)
 
-        parts = []
-        if getattr(response, "candidates", None):
-            candidate = response.candidates[0]
-            if getattr(candidate, "content", None):
-                parts = list(getattr(candidate.content, "parts", []) or [])
-
-        # Check if the model's response contains any tool calls
-        function_calls = [p.function_call for p in parts if getattr(p, "function_call", None)]
-        if not function_calls:
-            # No tool call, this is the final answer
-            serializable_parts = parts_to_dict(parts)
-            add_message_to_db(request.thread_id, {"role": "model", "parts": serializable_parts})
-            break
-
-        # --- Process Tool Calls ---
-        # Save the model's tool-calling response to the database (for UI only)
-        serializable_parts = parts_to_dict(parts)
-        add_message_to_db(request.thread_id, {"role": "model", "parts": serializable_parts})
-
-        # IMPORTANT: Do NOT append model functionCall parts to API history
-
-        # 3. Execute the function calls and gather responses
-        tool_response_parts = []
-        for fc in function_calls:
-            function_name = fc.name
-            function_args = dict(fc.args)
-
-            if function_name in tool_functions:
-                function_to_call = tool_functions[function_name]
-
-                # Await coroutines, run sync functions in a thread
-                if asyncio.iscoroutinefunction(function_to_call):
-                    tool_output = await function_to_call(**function_args)
-                else:
-                    tool_output = await asyncio.to_thread(function_to_call, **function_args)
-
-                tool_response_parts.append(
-                    types.Part.from_function_response(
-                        name=function_name,
-                        response=normalize_tool_output(tool_output),
+    try:
+        # --- Core Agent Loop ---
+        # This loop allows the model to make multiple tool calls to fulfill a request.
+        # See: https://ai.google.dev/gemini-api/docs/thinking
+        while True:
+            final = budget.must_finish()
+            if final:
+                # Out of budget: forbid tool calls so the model has to answer now
+                # See: https://ai.google.dev/gemini-api/docs/function-calling#function_calling_modes
+                config = types.GenerateContentConfig(
+                    tools=[tools],
+                    tool_config=types.ToolConfig(
+                        function_calling_config=types.FunctionCallingConfig(mode="NONE")
+                    ),
+                    system_instruction=FINAL_ANSWER_INSTRUCTION,
+                )
+            else:
+                config = types.GenerateContentConfig(tools=[tools])
+            budget.iterations += 1
+
+            # Stream the response so text reaches the client as soon as it is generated
+            # See: https://ai.google.dev/gemini-api/docs/text-generation#streaming-responses
+            # The whole call (scheduler wait, request and every chunk) must finish by the deadline.
+            # Only the awaits are timed, never a `yield`, which would time the client instead.
+            deadline = asyncio.get_running_loop().time() + budget.model_timeout(final)
+            parts = []
+            stream = None
+            timed_out = False
+            try:
+                async with asyncio.timeout_at(deadline):
+                    stream = await aclient.models.generate_content_stream(
+                        model=CHAT_MODEL,
+                        contents=history,
+                        config=config,
                     )
+                while True:
+                    async with asyncio.timeout_at(deadline):
+                        chunk = await anext(stream, None)
+                    if chunk is None:
+                        break
+                    if not getattr(chunk, "candidates", None):
+                        continue
+                    content = getattr(chunk.candidates[0], "content", None)
+                    for part in (getattr(content, "parts", None) or []):
+                        parts.append(part)
+                        if getattr(part, "text", None):
+                            yield {"type": "text", "text": part.text}
+            except TimeoutError:
+                timed_out = True
+                budget.model_timed_out()
+                if stream is not None:
+                    await stream.aclose()
+            parts = merge_streamed_parts(parts)
+
+            if timed_out and not final:
+                # No time left for tools; the reserved time goes to the final answer.
+                # Text streamed by the abandoned call is not part of the answer: tell the client
+                if any(getattr(p, "text", None) for p in parts):
+                    yield {"type": "reset"}
+                continue
+            if timed_out:
+                # Even the final answer ran out of time: end the turn with a notice, after
+                # whatever text was streamed, so a cut-off answer is never passed off as complete
+                streamed = any(getattr(p, "text", None) for p in parts)
+                notice = f"\n\n{TURN_TIMEOUT_MESSAGE}" if streamed else TURN_TIMEOUT_MESSAGE
+                parts = [p for p in parts if getattr(p, "text", None)] + [types.Part(text=notice)]
+                yield {"type": "text", "text": notice}
+
+            # Check if the model's response contains any tool calls
+            function_calls = [p.function_call for p in parts if getattr(p, "function_call", None)]
+            if not function_calls or final:
+                # No tool call (or no budget left to run one), this is the final answer
+                serializable_parts = parts_to_dict(parts)
+                await message_writer.add(
+                    thread_id, {"role": "model", "parts": serializable_parts, "meta": {"budget": budget.usage()}}
                 )
+                break
+
+            # --- Process Tool Calls ---
+            # Save the model's tool-calling response to the database (for UI only)
+            serializable_parts = parts_to_dict(parts)
+            await message_writer.add(thread_id, {"role": "model", "parts": serializable_parts})
+
+            # IMPORTANT: Do NOT append model functionCall parts to API history
+
+            # 3. Execute the function calls concurrently, reporting each result as it arrives
+            for fc in function_calls:
+                yield {"type": "tool_call", "name": fc.name, "args": dict(fc.args or {})}
+            tool_response_parts: list = [None] * len(function_calls)
+            async for index, part in iter_function_calls(function_calls, budget):
+                tool_response_parts[index] = part
+                fr = part.function_response
+                yield {"type": "tool_result", "name": fr.name, "response": dict(fr.response)}
 
-        # 4. Add tool responses to history and continue the loop
-        if tool_response_parts:
+            # 4. Add tool responses to history and continue the loop
             # Add serializable version to the database
             serializable_tool_responses = parts_to_dict(tool_response_parts)
-            add_message_to_db(request.thread_id, {"role": "user", "parts": serializable_tool_responses})
+            await message_writer.add(thread_id, {"role": "user", "parts": serializable_tool_responses})
 
             # Add rich object version to in-memory history
             history.append({"role": "user", "parts": tool_response_parts})
+    finally:
+        # Every message of the turn is committed together, before we answer
+        await message_writer.end_turn(thread_id)
 
+    yield {"type": "done", "budget": budget.usage()}
+
+
+# --- API Endpoints ---
+@router.post("/chat")
+async def chat(request: ChatRequest):
+    """The main agent endpoint with a multi-step reasoning loop."""
+    async for _ in run_agent_turn(request.thread_id, request.prompt):
+        pass
     return {"status": "ok"}
 
 
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Runs the agent like /chat, streaming text deltas and tool activity as Server-Sent Events."""
+
+    async def events():
+        try:
+            async for event in run_agent_turn(request.thread_id, request.prompt):
+                yield format_sse(event)
+        except Exception as e:
+            print(f"Error in streamed chat turn: {e}")
+            yield format_sse({"type": "error", "message": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/generate_npc")
-async def generate_npc_endpoint(request: ToolRequest):
+async def generate_npc_endpoint(request: GenerationRequest):
     """Generates a non-player character (NPC)."""
-    return await asyncio.to_thread(generate_npc_details, request.prompt)
+    return await generate_npc_details(request.prompt, fresh=request.fresh)
 
 
 @router.post("/generate_encounter")
-async def generate_encounter_endpoint(request: ToolRequest):
+async def generate_encounter_endpoint(request: GenerationRequest):
     """Generates a combat encounter."""
-    return await asyncio.to_thread(generate_encounter_details, request.prompt)
+    return await generate_encounter_details(request.prompt, fresh=request.fresh)
+
+
+@router.post("/generate_npc/batch")
+async def generate_npc_batch_endpoint(request: BatchGenerationRequest):
+    """Generates many NPCs at once, streaming each one back as NDJSON when it is ready."""
+    items = batch_items(request)
+    return StreamingResponse(stream_batch(items, generate_npc_details), media_type="application/x-ndjson")
+
+
+@router.post("/generate_encounter/batch")
+async def generate_encounter_batch_endpoint(request: BatchGenerationRequest):
+    """Generates many encounters at once, streaming each one back as NDJSON when it is ready."""
+    items = batch_items(request)
+    return StreamingResponse(stream_batch(items, generate_encounter_details), media_type="application/x-ndjson")
 
 
 @router.post("/roll_dice")
 async def roll_dice_endpoint(request: ToolRequest):
     """Rolls dice based on a standard dice notation string."""
-    return await asyncio.to_thread(roll_dice_sync, request.prompt)
+    # Rolling is pure CPU work that finishes in microseconds; no thread needed
+    return roll_dice_sync(request.prompt)
+
+
+@router.post("/roll_dice/bulk")
+async def roll_dice_bulk_endpoint(request: BulkRollRequest):
+    """Rolls many labelled dice expressions in one vectorised pass (initiative, mass combat)."""
+    # Bounded by DICE_MAX_COUNT dice, so this stays a few milliseconds of NumPy work
+    result = roll_dice_many_sync(
+        rolls=[roll.model_dump() for roll in request.rolls],
+        expression=request.expression,
+        count=request.count,
+        target=request.target,
+    )
+    if "error" in result:
+        raise HTTPException(status_code=422, detail=result["error"])
+    return result
+
+
+@router.post("/dice/distribution")
+async def dice_distribution_endpoint(request: DiceDistributionRequest):
+    """Computes the exact probability distribution of a dice expression."""
+    # Large distributions take a few hundred milliseconds of NumPy work, so keep them off the event loop
+    result = await asyncio.to_thread(dice_distribution_sync, request.expression, request.target)
+    if "error" in result:
+        raise HTTPException(status_code=422, detail=result["error"])
+    return result
 
 
 @router.post("/ask_lore_keeper")
 async def ask_lore_keeper_endpoint(request: ToolRequest):
     """Answers questions about the campaign's lore and world."""
-    return await asyncio.to_thread(ask_rag_question, request.prompt)
+    return await ask_rag_question(request.prompt)
 
 
 @router.get("/")
@@ -227,8 +593,51 @@ async def read_root():
     return {"message": "TTRPG GM Assistant API is running!"}
 
 
+@router.get("/health")
+async def health():
+    """Reports whether the message store is reachable."""
+    return {
+        "database": await check_health(),
+        "writer": message_writer.stats(),
+    }
+
+
+@router.get("/metrics")
+async def metrics():
+    """Reports cache and queue statistics for tuning."""
+    return {
+        "history_cache": history_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "lore_answer_cache": lore_answer_cache.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "llm_scheduler": scheduler.stats(),
+        "intent_router": intent_router.stats(),
+        "writer": message_writer.stats(),
+    }
+
+
 @router.get("/history/{thread_id}")
-async def get_history(thread_id: str):
-    """Retrieves the chat history for a given thread_id."""
-    messages = get_messages_from_db(thread_id)
-    return {"messages": messages}
+async def get_history(
+    thread_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    include_parts: bool = True,
+):
+    """
+    Retrieves the chat history for a given thread_id.
+
+    Use `limit` with `before_id` to page backwards through older messages,
+    or `after_id` to fetch only messages newer than the last one you have.
+    Set `include_parts=false` to list messages without loading their payloads.
+    """
+    await message_writer.flush(thread_id)
+    messages = await get_messages(
+        thread_id, limit=limit, before_id=before_id, after_id=after_id, include_parts=include_parts
+    )
+    return {
+        "messages": messages,
+        "first_id": messages[0]["id"] if messages else None,
+        "last_id": messages[-1]["id"] if messages else None,
+    }
@@ -0,0 +1,79 @@
+"""Awaitable database functions for use from async endpoints."""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from backend.database import database
+from backend.database.history_cache import CachedHistory
+
+T = TypeVar("T")
+
+# Database calls get their own threads, so a slow disk never blocks the event loop
+# and never competes with tools or LLM calls for the default `asyncio.to_thread` pool
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        # One worker per pooled connection; more threads would only wait for a connection
+        _executor = ThreadPoolExecutor(max_workers=database.pool.size, thread_name_prefix="db")
+    return _executor
+
+
+async def run_in_db_executor(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Runs a blocking database function on the database thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def get_messages(
+    thread_id: str,
+    limit: Optional[int] = None,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    include_parts: bool = True,
+) -> List[Dict[str, Any]]:
+    """Awaitable version of `get_messages_from_db`."""
+    return await run_in_db_executor(
+        database.get_messages_from_db,
+        thread_id,
+        limit=limit,
+        before_id=before_id,
+        after_id=after_id,
+        include_parts=include_parts,
+    )
+
+
+async def add_messages(items: List[Tuple[str, Dict[str, Any]]]):
+    """Awaitable version of `add_messages_to_db`; commits the whole batch in one transaction."""
+    await run_in_db_executor(database.add_messages_to_db, items)
+
+
+async def load_history(thread_id: str) -> CachedHistory:
+    """Awaitable version of `load_thread_history`."""
+    return await run_in_db_executor(database.load_thread_history, thread_id)
+
+
+async def get_summary(thread_id: str) -> Optional[Dict[str, Any]]:
+    """Awaitable version of `get_thread_summary`."""
+    return await run_in_db_executor(database.get_thread_summary, thread_id)
+
+
+async def save_summary(thread_id: str, summary: str, last_message_id: int):
+    """Awaitable version of `save_thread_summary`."""
+    await run_in_db_executor(database.save_thread_summary, thread_id, summary, last_message_id)
+
+
+async def check_health() -> Dict[str, Any]:
+    """Awaitable version of `check_db_health`."""
+    return await run_in_db_executor(database.check_db_health)
+
+
+def shutdown_executor():
+    """Waits for in-flight database calls to finish and stops the database threads."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
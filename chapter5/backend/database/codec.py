@@ -0,0 +1,38 @@
+"""Encoding of message parts for storage in the messages table."""
+import json
+import os
+import zlib
+from typing import Any, Tuple, Union
+
+# Storage formats, recorded per row in messages.encoding
+JSON = "json"  # plain JSON text (the original format)
+ZLIB_JSON = "json+zlib"  # zlib-compressed UTF-8 JSON, stored as a BLOB
+
+# Payloads smaller than this are stored as plain JSON; compressing them saves little
+COMPRESS_MIN_BYTES = int(os.getenv("DB_COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_LEVEL = 6
+
+
+def encode_parts(parts: Any) -> Tuple[str, Union[str, bytes]]:
+    """
+    Serialises message parts for storage, compressing large payloads such as tool outputs.
+
+    Returns:
+        The encoding tag and the value for the `parts` column.
+    """
+    text = json.dumps(parts, separators=(",", ":"))
+    if len(text) < COMPRESS_MIN_BYTES:
+        return JSON, text
+    compressed = zlib.compress(text.encode("utf-8"), COMPRESS_LEVEL)
+    if len(compressed) >= len(text):
+        return JSON, text
+    return ZLIB_JSON, compressed
+
+
+def decode_parts(encoding: str, value: Union[str, bytes]) -> Any:
+    """Inverse of `encode_parts`; rows written before compression existed are plain JSON."""
+    if encoding == ZLIB_JSON:
+        return json.loads(zlib.decompress(value))
+    if encoding in (JSON, None):
+        return json.loads(value)
+    raise ValueError(f"Unknown message encoding: {encoding!r}")
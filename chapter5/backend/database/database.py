@@ -1,62 +1,221 @@
 """Database setup and functions for the TTRPG GM Assistant."""
 import json
-import os
-import sqlite3
-from contextlib import closing
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+
+from backend.database.codec import decode_parts, encode_parts
+from backend.database.history_cache import CachedHistory, ThreadState, filter_message_for_api, history_cache
+from backend.database.migrations import apply_migrations
+from backend.database.pool import ConnectionPool
 
 DB_FILE = "messages.db"
 
+# A single pool of long-lived, WAL-mode connections shared by the whole app
+pool = ConnectionPool(DB_FILE)
+
 
-def create_db_and_tables():
+def create_db_and_tables() -> int:
     """
-    Creates the SQLite database and the messages table.
-    Deletes the old database file first to ensure a fresh start.
+    Creates the SQLite database if needed and upgrades its schema in place.
+
+    Existing threads are kept across restarts; see `migrations.py` for the schema history.
+
+    Returns:
+        The schema version of the database.
     """
-    # Delete the old database file if it exists to ensure a fresh schema
-    if os.path.exists(DB_FILE):
-        os.remove(DB_FILE)
+    # The pool may have been closed by an earlier shutdown in this process
+    pool.reopen()
+    with pool.connection() as conn:
+        return apply_migrations(conn)
 
-    with closing(sqlite3.connect(DB_FILE)) as conn:
-        with closing(conn.cursor()) as cursor:
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    thread_id TEXT NOT NULL,
-                    role TEXT NOT NULL,
-                    parts TEXT NOT NULL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            """
-            )
-            conn.commit()
+
+def close_db():
+    """Closes all pooled database connections."""
+    pool.close()
+
+
+def check_db_health() -> Dict[str, Any]:
+    """Reports whether the message store is reachable and how the pool is configured."""
+    return pool.health_check()
 
 
-def add_message_to_db(thread_id: str, message: Dict[str, Any]):
-    """Adds a message (as a dict) to the database."""
-    with closing(sqlite3.connect(DB_FILE)) as conn:
-        with closing(conn.cursor()) as cursor:
-            # The 'parts' of a message are stored as a JSON string
-            parts_json = json.dumps(message.get("parts", ""))
-            cursor.execute(
-                "INSERT INTO messages (thread_id, role, parts) VALUES (?, ?, ?)",
-                (thread_id, message.get("role"), parts_json),
+def add_message_to_db(thread_id: str, message: Dict[str, Any]) -> int:
+    """Adds a message (as a dict) to the database and returns its id."""
+    return add_messages_to_db([(thread_id, message)])[0]
+
+
+def add_messages_to_db(items: List[Tuple[str, Dict[str, Any]]]) -> List[int]:
+    """
+    Adds several `(thread_id, message)` pairs to the database in a single transaction.
+
+    Returns:
+        The ids assigned to the messages, in order.
+    """
+    ids = []
+    # The id of each message's predecessor in its thread, so the history cache can tell
+    # whether another worker wrote to the thread since it was cached
+    previous_ids = []
+    last_ids: Dict[str, int] = {}
+    with pool.connection() as conn:
+        for thread_id, message in items:
+            # The 'parts' of a message are stored as JSON, compressed when large
+            encoding, parts = encode_parts(message.get("parts", ""))
+            # Optional bookkeeping such as the turn budget; stored but never sent to the model
+            meta = json.dumps(message["meta"]) if message.get("meta") else None
+            cursor = conn.execute(
+                "INSERT INTO messages (thread_id, role, parts, encoding, meta) VALUES (?, ?, ?, ?, ?)",
+                (thread_id, message.get("role"), parts, encoding, meta),
             )
-            conn.commit()
+            message_id = cursor.lastrowid
+            if thread_id not in last_ids:
+                # Read after the insert, while this transaction holds the write lock
+                row = conn.execute(
+                    "SELECT MAX(id) FROM messages WHERE thread_id = ? AND id < ?", (thread_id, message_id)
+                ).fetchone()
+                last_ids[thread_id] = row[0] or 0
+            previous_ids.append(last_ids[thread_id])
+            last_ids[thread_id] = message_id
+            ids.append(message_id)
+        conn.commit()
+    for (thread_id, message), message_id, previous_id in zip(items, ids, previous_ids):
+        history_cache.append(thread_id, message_id, message, previous_id)
+    return ids
+
+
+def get_messages_from_db(
+    thread_id: str,
+    limit: Optional[int] = None,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    include_parts: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    Retrieves messages for a given thread_id from the database, oldest first.
+
+    Messages are ordered by their autoincrement id, which is strictly monotonic,
+    unlike the one-second resolution of the timestamp column.
 
+    Args:
+        thread_id: The conversation thread.
+        limit: Maximum number of messages to return. Without `after_id`, the most recent ones are kept.
+        before_id: Only return messages with an id lower than this cursor.
+        after_id: Only return messages with an id higher than this cursor.
+        include_parts: If False, payloads are neither read nor decoded; only their stored size is returned.
 
-def get_messages_from_db(thread_id: str) -> List[Dict[str, Any]]:
-    """Retrieves all messages for a given thread_id from the database."""
+    Returns:
+        A list of `{"id", "role", "parts"}` dictionaries (`{"id", "role", "size"}` without parts),
+        with a "meta" dictionary on messages that have one.
+    """
+    columns = "id, role, parts, encoding, meta" if include_parts else "id, role, LENGTH(parts) AS size"
+    query = f"SELECT {columns} FROM messages WHERE thread_id = ?"
+    params: list = [thread_id]
+    if before_id is not None:
+        query += " AND id < ?"
+        params.append(before_id)
+    if after_id is not None:
+        query += " AND id > ?"
+        params.append(after_id)
+
+    # Paging forwards from a cursor reads ascending; otherwise read the newest page and flip it
+    newest_first = limit is not None and after_id is None
+    query += " ORDER BY id DESC" if newest_first else " ORDER BY id ASC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    with pool.connection() as conn:
+        rows = conn.execute(query, params).fetchall()
+    if newest_first:
+        rows.reverse()
+    if not include_parts:
+        return [{"id": row["id"], "role": row["role"], "size": row["size"]} for row in rows]
     messages = []
-    with closing(sqlite3.connect(DB_FILE)) as conn:
-        conn.row_factory = sqlite3.Row
-        with closing(conn.cursor()) as cursor:
-            cursor.execute(
-                "SELECT role, parts FROM messages WHERE thread_id = ? ORDER BY timestamp ASC",
-                (thread_id,),
-            )
-            rows = cursor.fetchall()
-            for row in rows:
-                messages.append({"role": row["role"], "parts": json.loads(row["parts"])})
+    for row in rows:
+        message = {"id": row["id"], "role": row["role"], "parts": decode_parts(row["encoding"], row["parts"])}
+        if row["meta"]:
+            message["meta"] = json.loads(row["meta"])
+        messages.append(message)
     return messages
+
+
+def get_thread_summary(thread_id: str) -> Optional[Dict[str, Any]]:
+    """Returns the rolling summary of a thread as `{"summary", "last_message_id"}`, if there is one."""
+    with pool.connection() as conn:
+        row = conn.execute(
+            "SELECT summary, last_message_id FROM thread_summaries WHERE thread_id = ?",
+            (thread_id,),
+        ).fetchone()
+    if row is None:
+        return None
+    return {"summary": row["summary"], "last_message_id": row["last_message_id"]}
+
+
+def save_thread_summary(thread_id: str, summary: str, last_message_id: int):
+    """Creates or replaces the rolling summary of a thread."""
+    with pool.connection() as conn:
+        conn.execute(
+            """
+            INSERT INTO thread_summaries (thread_id, summary, last_message_id) VALUES (?, ?, ?)
+            ON CONFLICT(thread_id) DO UPDATE SET
+                summary = excluded.summary,
+                last_message_id = excluded.last_message_id,
+                updated_at = CURRENT_TIMESTAMP
+            """,
+            (thread_id, summary, last_message_id),
+        )
+        conn.commit()
+
+
+def _get_thread_state(conn, thread_id: str) -> ThreadState:
+    row = conn.execute(
+        """
+        SELECT
+            (SELECT MAX(id) FROM messages WHERE thread_id = ?) AS max_id,
+            (SELECT version FROM thread_versions WHERE thread_id = ?) AS version,
+            (SELECT last_message_id FROM thread_summaries WHERE thread_id = ?) AS summary_cursor
+        """,
+        (thread_id, thread_id, thread_id),
+    ).fetchone()
+    return ThreadState(max_id=row["max_id"] or 0, version=row["version"] or 0, summary_cursor=row["summary_cursor"] or 0)
+
+
+def load_thread_history(thread_id: str) -> CachedHistory:
+    """
+    Returns the rolling summary and filtered API messages of a thread, from the history cache if valid.
+
+    Validating a cached entry costs one indexed lookup; on a miss the summary and the messages
+    after the summary cursor are read in a single read transaction and cached.
+    """
+    with pool.connection() as conn:
+        state = _get_thread_state(conn, thread_id)
+        cached = history_cache.get(thread_id, state)
+        if cached is not None:
+            return cached
+
+        conn.execute("BEGIN")
+        try:
+            # Re-read the state inside the transaction so it matches the rows we load
+            state = _get_thread_state(conn, thread_id)
+            summary_row = conn.execute(
+                "SELECT summary FROM thread_summaries WHERE thread_id = ?", (thread_id,)
+            ).fetchone()
+            rows = conn.execute(
+                "SELECT id, role, parts, encoding FROM messages WHERE thread_id = ? AND id > ? ORDER BY id ASC",
+                (thread_id, state.summary_cursor),
+            ).fetchall()
+        finally:
+            conn.commit()
+
+    messages = []
+    for row in rows:
+        parts = decode_parts(row["encoding"], row["parts"])
+        filtered = filter_message_for_api({"id": row["id"], "role": row["role"], "parts": parts})
+        if filtered is not None:
+            messages.append(filtered)
+    entry = CachedHistory(
+        summary=summary_row["summary"] if summary_row else None,
+        summary_cursor=state.summary_cursor,
+        messages=messages,
+        state=ThreadState(state.max_id, state.version, state.summary_cursor),
+    )
+    history_cache.put(thread_id, entry)
+    return entry
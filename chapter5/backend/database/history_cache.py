@@ -0,0 +1,169 @@
+"""A process-local LRU cache of the API history of recently active threads."""
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+# Upper bound on the (estimated) memory used by cached histories
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def filter_message_for_api(message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Keeps only API-acceptable parts (text, functionResponse) of a message, or None if nothing is left."""
+    safe_parts: list[dict] = []
+    for part in message.get("parts", []):
+        if "text" in part:
+            safe_parts.append({"text": part["text"]})
+        elif "functionResponse" in part:
+            # pass-through (already serializable)
+            safe_parts.append(part)
+        # intentionally skip functionCall objects
+    if not safe_parts:
+        return None
+    filtered = {"role": message.get("role"), "parts": safe_parts}
+    if "id" in message:
+        filtered["id"] = message["id"]
+    return filtered
+
+
+@dataclass
+class ThreadState:
+    """What the database says about a thread, used to detect out-of-band changes."""
+
+    max_id: int
+    version: int
+    summary_cursor: int
+
+
+@dataclass
+class CachedHistory:
+    """The rolling summary of a thread plus its filtered messages after the summary cursor."""
+
+    summary: Optional[str]
+    summary_cursor: int
+    messages: List[Dict[str, Any]]
+    state: ThreadState
+    size: int = field(default=0)
+
+
+def _message_size(message: Dict[str, Any]) -> int:
+    return len(json.dumps(message.get("parts", []))) + 64
+
+
+class HistoryCache:
+    """
+    LRU cache of `CachedHistory` per thread_id, bounded by estimated memory use.
+
+    Entries are appended to as messages are committed, so an active thread is read from
+    SQLite once. An append is only accepted if it directly follows the last cached message;
+    a gap means another worker inserted rows in between, and the entry is dropped. Callers
+    also validate an entry against the current `ThreadState` before use; any mismatch (rows
+    inserted by another worker since the last append, or edited or deleted by hand) means
+    the entry is dropped and rebuilt from the database.
+    """
+
+    def __init__(self, max_bytes: int = HISTORY_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CachedHistory]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, thread_id: str, state: ThreadState) -> Optional[CachedHistory]:
+        """Returns the cached history if it is still consistent with `state`."""
+        with self._lock:
+            entry = self._entries.get(thread_id)
+            if entry is not None and entry.state != state:
+                self._remove(thread_id)
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(thread_id)
+            self.hits += 1
+            return entry
+
+    def put(self, thread_id: str, entry: CachedHistory):
+        """Caches a history freshly loaded from the database."""
+        entry.size = sum(_message_size(m) for m in entry.messages)
+        with self._lock:
+            self._remove(thread_id)
+            self._entries[thread_id] = entry
+            self._bytes += entry.size
+            self._evict()
+
+    def append(self, thread_id: str, message_id: int, message: Dict[str, Any], previous_id: int):
+        """
+        Records a newly committed message on the cached thread, if it is cached.
+
+        `previous_id` is the id of the thread's message right before this one. If it is not the
+        last message the entry knows about, another worker wrote to the thread in between; the
+        entry is dropped rather than appended to, since it would otherwise miss those rows.
+        """
+        with self._lock:
+            entry = self._entries.get(thread_id)
+            if entry is None or message_id <= entry.state.max_id:
+                return
+            if entry.state.max_id != previous_id:
+                self._remove(thread_id)
+                self.invalidations += 1
+                return
+            entry.state.max_id = message_id
+            filtered = filter_message_for_api({**message, "id": message_id})
+            if filtered is not None:
+                entry.messages.append(filtered)
+                size = _message_size(filtered)
+                entry.size += size
+                self._bytes += size
+                self._evict()
+
+    def fold(self, thread_id: str, summary: str, summary_cursor: int):
+        """Drops messages that were folded into a new summary of the thread."""
+        with self._lock:
+            entry = self._entries.get(thread_id)
+            if entry is None:
+                return
+            kept = [m for m in entry.messages if m["id"] > summary_cursor]
+            dropped = sum(_message_size(m) for m in entry.messages) - sum(_message_size(m) for m in kept)
+            entry.messages = kept
+            entry.summary = summary
+            entry.summary_cursor = summary_cursor
+            entry.state.summary_cursor = summary_cursor
+            entry.size -= dropped
+            self._bytes -= dropped
+
+    def _remove(self, thread_id: str):
+        entry = self._entries.pop(thread_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict(self):
+        # Always keep the most recently used entry, even if it alone exceeds the cap
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            thread_id = next(iter(self._entries))
+            self._remove(thread_id)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Reports size and effectiveness of the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "threads": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+# Shared cache, appended to by `add_messages_to_db`
+history_cache = HistoryCache()
@@ -0,0 +1,133 @@
+"""Versioned, in-place schema migrations for the message store."""
+import sqlite3
+from typing import Callable, List
+
+
+def _create_messages_table(conn: sqlite3.Connection):
+    """Creates the messages table."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            thread_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            parts TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+
+def _add_thread_index(conn: sqlite3.Connection):
+    """Covers the per-thread lookups and their ordering by id."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_thread_id_id ON messages (thread_id, id)")
+
+
+def _create_thread_summaries_table(conn: sqlite3.Connection):
+    """Stores the rolling summary of each thread and the last message folded into it."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS thread_summaries (
+            thread_id TEXT PRIMARY KEY,
+            summary TEXT NOT NULL,
+            last_message_id INTEGER NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+
+def _add_thread_versions(conn: sqlite3.Connection):
+    """Bumps a per-thread version whenever messages are edited or deleted, so caches can notice."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS thread_versions (
+            thread_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+        """
+    )
+    for event, row in (("UPDATE", "OLD"), ("DELETE", "OLD")):
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS messages_after_{event.lower()} AFTER {event} ON messages
+            BEGIN
+                INSERT INTO thread_versions (thread_id, version) VALUES ({row}.thread_id, 1)
+                ON CONFLICT(thread_id) DO UPDATE SET version = version + 1;
+            END
+            """
+        )
+
+
+def _add_parts_encoding(conn: sqlite3.Connection):
+    """Tags each row with the format of its `parts` value; existing rows are plain JSON."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(messages)")]
+    if "encoding" not in columns:
+        conn.execute("ALTER TABLE messages ADD COLUMN encoding TEXT NOT NULL DEFAULT 'json'")
+
+
+def _add_message_meta(conn: sqlite3.Connection):
+    """Adds an optional JSON `meta` column for bookkeeping that is never sent to the model."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(messages)")]
+    if "meta" not in columns:
+        conn.execute("ALTER TABLE messages ADD COLUMN meta TEXT")
+
+
+# Ordered migration steps; step N upgrades the schema from version N-1 to version N.
+# Only ever append to this list: released steps must never change.
+# Steps use IF NOT EXISTS so that databases created before versioning are adopted in place.
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _create_messages_table,
+    _add_thread_index,
+    _create_thread_summaries_table,
+    _add_thread_versions,
+    _add_parts_encoding,
+    _add_message_meta,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Returns the schema version recorded in the database (0 for a new database)."""
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """
+    Upgrades the schema to the latest version, keeping all existing data.
+
+    Checking an up-to-date database is a single-row lookup, so startup cost does not
+    depend on how many messages are stored. Each step runs in its own transaction
+    together with its version bump, and `BEGIN IMMEDIATE` makes concurrent workers
+    wait for each other instead of applying the same step twice.
+
+    Args:
+        conn: An open connection to the database.
+
+    Returns:
+        The schema version after migrating.
+    """
+    current = get_schema_version(conn)
+    conn.commit()
+    if current > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version {current} is newer than this code supports ({SCHEMA_VERSION})."
+        )
+
+    while current < SCHEMA_VERSION:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another worker may have migrated while we waited for the write lock
+            current = get_schema_version(conn)
+            if current < SCHEMA_VERSION:
+                MIGRATIONS[current](conn)
+                current += 1
+                conn.execute("INSERT INTO schema_version (version) VALUES (?)", (current,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return current
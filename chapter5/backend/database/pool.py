@@ -0,0 +1,143 @@
+"""A small pool of long-lived SQLite connections for the message store."""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List
+
+# Pragmas applied to every pooled connection.
+# See: https://www.sqlite.org/pragma.html and https://www.sqlite.org/wal.html
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA mmap_size=268435456",  # 256 MiB
+    "PRAGMA cache_size=-16000",  # ~16 MiB per connection (negative = KiB)
+    "PRAGMA temp_store=MEMORY",
+)
+
+DEFAULT_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DEFAULT_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+
+class PoolClosedError(RuntimeError):
+    """Raised when a connection is requested from a closed pool."""
+
+
+class ConnectionPool:
+    """
+    A bounded pool of SQLite connections configured for concurrent access.
+
+    Connections are created lazily up to `size` and handed out one caller at a time,
+    so they are opened with `check_same_thread=False` and may move between threads.
+    """
+
+    def __init__(self, db_file: str, size: int = DEFAULT_POOL_SIZE, timeout: float = DEFAULT_ACQUIRE_TIMEOUT):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.db_file = db_file
+        self.size = size
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=size)
+        self._all: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file, timeout=self.timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise PoolClosedError("The connection pool has been closed.")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._all) < self.size:
+                conn = self._connect()
+                self._all.append(conn)
+                return conn
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No database connection available after {self.timeout}s.") from None
+
+    def _release(self, conn: sqlite3.Connection):
+        if self._closed:
+            conn.close()
+            return
+        # Never hand a connection with an open transaction to the next caller
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put_nowait(conn)
+
+    def _discard(self, conn: sqlite3.Connection):
+        with self._lock:
+            if conn in self._all:
+                self._all.remove(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrows a connection for the duration of the `with` block."""
+        conn = self._acquire()
+        try:
+            yield conn
+        except sqlite3.DatabaseError:
+            # A broken connection is replaced rather than returned to the pool
+            if self._is_healthy(conn):
+                self._release(conn)
+            else:
+                self._discard(conn)
+            raise
+        except BaseException:
+            self._release(conn)
+            raise
+        else:
+            self._release(conn)
+
+    @staticmethod
+    def _is_healthy(conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def health_check(self) -> dict:
+        """Runs a trivial query on one pooled connection and reports the pool state."""
+        with self.connection() as conn:
+            journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            ok = self._is_healthy(conn)
+        return {
+            "ok": ok,
+            "journal_mode": journal_mode,
+            "open_connections": len(self._all),
+            "idle_connections": self._idle.qsize(),
+            "size": self.size,
+        }
+
+    def close(self):
+        """Closes every connection; connections still borrowed are closed on release."""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+        with self._lock:
+            self._all.clear()
+
+    def reopen(self):
+        """Allows a closed pool to hand out connections again (e.g. after a restart of the app)."""
+        self._closed = False
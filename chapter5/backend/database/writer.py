@@ -0,0 +1,140 @@
+"""A write-behind queue that group-commits messages to the database."""
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.database.async_database import add_messages
+
+# How long a caller waits for its messages to be committed:
+# - "strict": every add waits for the commit that contains it
+# - "turn":   adds return immediately; the turn's messages are committed together when
+#             it ends, and the chat turn waits for that commit
+# - "relaxed": like "turn", but nothing waits; the commit happens in the background
+DB_DURABILITY = os.getenv("DB_DURABILITY", "turn")
+DURABILITY_MODES = ("strict", "turn", "relaxed")
+
+# Upper bound on the number of messages committed in a single transaction
+MAX_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", "256"))
+
+_PendingMessage = Tuple[str, Dict[str, Any], asyncio.Future]
+
+
+class MessageWriter:
+    """
+    Drains queued messages in a single background task and commits each batch in one transaction.
+
+    Outside "strict" mode, the messages of a turn are held back until `end_turn` and then
+    queued together. The agent loop awaits an LLM or tool call between its writes, so
+    queueing them one by one would commit each on its own. All messages queued while a commit
+    is in flight land in the next batch, so one fsync covers every turn that ended in that window.
+    """
+
+    def __init__(self, durability: str = DB_DURABILITY, max_batch_size: int = MAX_BATCH_SIZE):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durability must be one of {DURABILITY_MODES}, got {durability!r}")
+        self.durability = durability
+        self.max_batch_size = max_batch_size
+        self._queue: Optional["asyncio.Queue[_PendingMessage]"] = None
+        self._task: Optional[asyncio.Task] = None
+        # The most recent pending write per thread; batches commit in order, so awaiting it flushes the thread
+        self._last_pending: Dict[str, asyncio.Future] = {}
+        # Messages of turns still in progress, per thread
+        self._turns: Dict[str, List[_PendingMessage]] = {}
+        self.batches_committed = 0
+        self.messages_committed = 0
+
+    def start(self):
+        """Starts the background writer on the running event loop."""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Commits everything still queued, then stops the background writer."""
+        if self._task is None:
+            return
+        await self.flush()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._queue = None
+
+    async def add(self, thread_id: str, message: Dict[str, Any]):
+        """Adds a message to the thread's turn; in "strict" mode, queues it and waits for its commit."""
+        if self._queue is None:
+            raise RuntimeError("MessageWriter.start() must be called before adding messages.")
+        future = asyncio.get_running_loop().create_future()
+        # Nobody awaits the future in "relaxed" mode; retrieve its exception so it is not reported as lost
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._last_pending[thread_id] = future
+        if self.durability == "strict":
+            self._queue.put_nowait((thread_id, message, future))
+            await future
+        else:
+            self._turns.setdefault(thread_id, []).append((thread_id, message, future))
+
+    def _release(self, thread_id: Optional[str] = None):
+        """Queues the held-back messages of one thread's turn (or of every thread's) in one go."""
+        threads = [thread_id] if thread_id is not None else list(self._turns)
+        for thread in threads:
+            # No await between the puts, so the writer sees the whole turn at once
+            for item in self._turns.pop(thread, []):
+                self._queue.put_nowait(item)
+
+    async def flush(self, thread_id: Optional[str] = None):
+        """Waits until every message added so far (for one thread, or for all threads) is committed."""
+        if self._queue is not None:
+            self._release(thread_id)
+        if thread_id is not None:
+            pending = [self._last_pending.get(thread_id)]
+        else:
+            pending = list(self._last_pending.values())
+        pending = [f for f in pending if f is not None and not f.done()]
+        if pending:
+            await asyncio.gather(*pending)
+
+    async def end_turn(self, thread_id: str):
+        """Queues the turn's messages as one batch and applies the durability mode's guarantee."""
+        self._release(thread_id)
+        if self.durability != "relaxed":
+            await self.flush(thread_id)
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await add_messages([(t, m) for t, m, _ in batch])
+            except Exception as e:
+                print(f"Error committing {len(batch)} queued messages: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                self.batches_committed += 1
+                self.messages_committed += len(batch)
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+            finally:
+                for thread_id, _, future in batch:
+                    if self._last_pending.get(thread_id) is future:
+                        del self._last_pending[thread_id]
+
+    def stats(self) -> Dict[str, Any]:
+        """Reports queue depth and how well writes are being grouped."""
+        return {
+            "durability": self.durability,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "held_for_turn": sum(len(messages) for messages in self._turns.values()),
+            "batches_committed": self.batches_committed,
+            "messages_committed": self.messages_committed,
+        }
+
+
+# Shared writer, started and stopped by the FastAPI lifespan
+message_writer = MessageWriter()
@@ -1,24 +1,38 @@
 """Main application file for the TTRPG GM Assistant API."""
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_mcp import FastApiMCP
 
 from backend.api.endpoints import router as api_router
-from backend.database.database import create_db_and_tables
+from backend.database.async_database import shutdown_executor
+from backend.database.database import check_db_health, close_db, create_db_and_tables
+from backend.database.writer import message_writer
+from backend.services.response_cache import response_cache
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Creates the database and starts the message writer; drains and closes both on shutdown."""
+    create_db_and_tables()
+    check_db_health()
+    message_writer.start()
+    yield
+    await message_writer.stop()
+    shutdown_executor()
+    close_db()
+    response_cache.close()
+
 
 app = FastAPI(
     title="TTRPG GM Assistant API",
     description="Backend API for the Streamlit GM Assistant.",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Creates the database and tables on startup."""
-    create_db_and_tables()
-
-
 # Add CORS middleware to allow all origins
 app.add_middleware(
     CORSMiddleware,
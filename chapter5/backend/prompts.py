@@ -27,3 +27,29 @@ Context:
 
 Question: {prompt}
 """
+
+# --- History Summarisation ---
+SUMMARY_PROMPT_TEMPLATE = """
+You are keeping notes for a Game Master's assistant. Update the running summary of the conversation
+with the new messages below. Keep every fact that may matter later: names, NPC and encounter details,
+dice results, decisions, open questions and plans. Be concise and write plain prose, no preamble.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+"""
+
+# --- Agent Loop ---
+FINAL_ANSWER_INSTRUCTION = """
+You have reached the tool budget for this request. Do not call any more tools.
+Answer the Game Master now using only the information you already have, and briefly
+say what you could not look up or generate.
+"""
+
+# Shown (and stored) when even the final answer could not be generated before the turn's deadline
+TURN_TIMEOUT_MESSAGE = (
+    "I ran out of time before I could finish answering. Please try again, "
+    "or ask for something smaller."
+)
@@ -0,0 +1,152 @@
+"""A persistent cache of text embeddings, shared by lore questions and lore ingestion."""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from backend.services.llm import aclient, backend_path
+
+EMBEDDING_CACHE_FILE = os.getenv("EMBEDDING_CACHE_FILE", backend_path("embedding_cache.db"))
+# Number of vectors kept in the in-memory LRU tier
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "4096"))
+
+
+def normalize_text(text: str) -> str:
+    """Normalises text so that trivially different spellings share an embedding."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def embedding_key(model: str, text: str) -> str:
+    """Cache key of the embedding of `text` by `model`."""
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Stores embeddings as float32 BLOBs in SQLite behind an in-memory LRU.
+
+    A 768-dimensional vector takes about 3 KiB on disk this way.
+    """
+
+    def __init__(self, db_file: str = EMBEDDING_CACHE_FILE, memory_entries: int = EMBEDDING_CACHE_MEMORY_ENTRIES):
+        self.db_file = db_file
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    vector BLOB NOT NULL
+                )
+                """
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Returns the cached vectors among `keys`, checking memory first, then disk."""
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                    self.memory_hits += 1
+                else:
+                    missing.append(key)
+            # Look the rest up on disk in bounded IN (...) batches
+            for start in range(0, len(missing), 500):
+                batch = missing[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection().execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    found[key] = vector
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+            self.misses += len(set(keys) - found.keys())
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, Sequence[float]]):
+        """Stores new vectors on disk and in memory."""
+        with self._lock:
+            rows = []
+            for key, values in vectors.items():
+                vector = np.asarray(values, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, model, vector.tobytes()))
+            conn = self._connection()
+            conn.executemany("INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)", rows)
+            conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Reports hits per tier and misses."""
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+        }
+
+
+# Shared by the lore keeper and by rag_setup.py
+embedding_cache = EmbeddingCache()
+
+
+def _plan(model: str, texts: Sequence[str]):
+    keys = [embedding_key(model, text) for text in texts]
+    cached = embedding_cache.get_many(keys)
+    # Embed each distinct missing text once
+    to_embed: Dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in to_embed:
+            to_embed[key] = text
+    return keys, cached, to_embed
+
+
+def _assemble(keys: List[str], cached: Dict[str, np.ndarray]) -> List[List[float]]:
+    return [cached[key].tolist() for key in keys]
+
+
+async def aembed_texts(model: str, texts: Sequence[str]) -> List[List[float]]:
+    """
+    Embeds texts, calling the API only for texts not in the cache.
+
+    Cache I/O runs in a thread; the API call goes through the scheduled async client, so it
+    shares the rate limits and priorities of every other LLM call.
+    """
+    keys, cached, to_embed = await asyncio.to_thread(_plan, model, texts)
+    if to_embed:
+        response = await aclient.models.embed_content(model=model, contents=list(to_embed.values()))
+        new = {key: embedding.values for key, embedding in zip(to_embed, response.embeddings)}
+        await asyncio.to_thread(embedding_cache.put_many, model, new)
+        cached.update({key: np.asarray(values, dtype=np.float32) for key, values in new.items()})
+    return _assemble(keys, cached)
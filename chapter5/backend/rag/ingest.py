@@ -0,0 +1,320 @@
+"""Streaming, incremental and resumable ingestion of a lore corpus into Chroma."""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, TextIO, Tuple
+
+from backend.rag.embedding_cache import aembed_texts
+from backend.services.llm import backend_path
+from backend.services.scheduler import batch_priority
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# Files picked up when ingesting a directory
+INGEST_EXTENSIONS = (".txt", ".md")
+# Upper bounds of one embedding request (the API accepts at most 100 texts per call)
+EMBED_BATCH_MAX_ITEMS = int(os.getenv("EMBED_BATCH_MAX_ITEMS", "100"))
+EMBED_BATCH_MAX_CHARS = int(os.getenv("EMBED_BATCH_MAX_CHARS", "200000"))
+# Embedding batches in flight at once; the shared LLM scheduler applies the rate limit
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+# Records which files were fully ingested, so an unchanged file is not even re-read
+INGEST_MANIFEST_FILE = os.getenv("INGEST_MANIFEST_FILE", backend_path("ingest_manifest.json"))
+INGEST_PROGRESS_SECONDS = float(os.getenv("INGEST_PROGRESS_SECONDS", "5"))
+# Characters read from a file at a time
+READ_BLOCK_CHARS = 64 * 1024
+# Number of ids read from or deleted in Chroma per request
+CHROMA_PAGE_SIZE = 1000
+
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list[str]:
+    """Splits text into overlapping chunks."""
+    if chunk_size <= overlap:
+        raise ValueError("chunk_size must be greater than overlap")
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        chunks.append(text[start:end])
+        start += chunk_size - overlap
+    return chunks
+
+
+def iter_chunks(stream: TextIO, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> Iterator[str]:
+    """Yields the same chunks as `chunk_text`, reading the text a block at a time."""
+    if chunk_size <= overlap:
+        raise ValueError("chunk_size must be greater than overlap")
+    step = chunk_size - overlap
+    buffer = ""
+    while True:
+        block = stream.read(READ_BLOCK_CHARS)
+        buffer += block
+        while len(buffer) >= chunk_size:
+            yield buffer[:chunk_size]
+            buffer = buffer[step:]
+        if not block:
+            break
+    # The tail: chunks that start before the end of the text but are shorter than chunk_size
+    while buffer:
+        yield buffer[:chunk_size]
+        if len(buffer) <= step:
+            break
+        buffer = buffer[step:]
+
+
+def chunk_id(source: str, chunk: str) -> str:
+    """
+    Content address of a chunk.
+
+    Unlike positional ids, an unchanged chunk keeps its id when text before it is edited,
+    so re-running ingestion only touches the chunks that actually changed.
+    """
+    return hashlib.sha256(f"{source}\0{chunk}".encode("utf-8")).hexdigest()[:32]
+
+
+def iter_corpus_files(root: str) -> Iterator[Tuple[str, str]]:
+    """Yields `(path, source)` for a single file, or for every text file under a directory in sorted order."""
+    if os.path.isfile(root):
+        yield root, os.path.basename(root)
+        return
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        for name in sorted(files):
+            if name.lower().endswith(INGEST_EXTENSIONS):
+                path = os.path.join(directory, name)
+                yield path, os.path.relpath(path, root).replace(os.sep, "/")
+
+
+def existing_ids(collection) -> Set[str]:
+    """Lists the ids already stored in the collection, a page at a time."""
+    ids: Set[str] = set()
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=CHROMA_PAGE_SIZE, offset=offset)["ids"]
+        ids.update(page)
+        if len(page) < CHROMA_PAGE_SIZE:
+            return ids
+        offset += CHROMA_PAGE_SIZE
+
+
+class Manifest:
+    """
+    The checkpoint of an ingestion: for each fully ingested file, its size, mtime and chunk ids.
+
+    A file is only recorded once all of its chunks are in Chroma, and the file is rewritten
+    atomically, so an interrupted run resumes by skipping the files recorded so far.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.files = json.load(f).get("files", {})
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable ingestion manifest {path}: {e}")
+
+    @staticmethod
+    def _signature(stat: os.stat_result) -> List[int]:
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def unchanged_ids(self, source: str, stat: os.stat_result) -> Optional[List[str]]:
+        """The chunk ids of `source` if it was ingested before and has not changed since."""
+        entry = self.files.get(source)
+        if entry is None or entry["signature"] != self._signature(stat):
+            return None
+        return entry["ids"]
+
+    def record(self, source: str, stat: os.stat_result, ids: List[str]):
+        self.files[source] = {"signature": self._signature(stat), "ids": ids}
+        self.save()
+
+    def prune(self, sources: Set[str]):
+        """Forgets files that are no longer part of the corpus."""
+        self.files = {source: entry for source, entry in self.files.items() if source in sources}
+        self.save()
+
+    def save(self):
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f)
+        os.replace(temporary, self.path)
+
+
+class IngestProgress:
+    """Counters of an ingestion run, printed every `INGEST_PROGRESS_SECONDS`."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.last_report = self.started
+        self.files_done = 0
+        self.files_skipped = 0
+        self.bytes_read = 0
+        self.chunks = 0
+        self.embedded = 0
+        self.unchanged = 0
+        self.deleted = 0
+        self.batches = 0
+
+    def maybe_report(self):
+        if time.monotonic() - self.last_report >= INGEST_PROGRESS_SECONDS:
+            self.report()
+
+    def report(self, final: bool = False):
+        self.last_report = time.monotonic()
+        elapsed = max(self.last_report - self.started, 1e-9)
+        print(
+            f"[ingest{' done' if final else ''}] {self.files_done} files ({self.files_skipped} unchanged), "
+            f"{self.chunks} chunks: {self.embedded} embedded, {self.unchanged} unchanged, {self.deleted} deleted | "
+            f"{self.bytes_read / 1e6:.1f} MB read, {self.chunks / elapsed:.0f} chunks/s, "
+            f"{self.embedded / elapsed:.0f} embedded/s, {elapsed:.1f}s"
+        )
+
+    def counts(self) -> Dict[str, Any]:
+        return {
+            "files": self.files_done,
+            "files_unchanged": self.files_skipped,
+            "chunks": self.chunks,
+            "added": self.embedded,
+            "unchanged": self.unchanged,
+            "deleted": self.deleted,
+            "batches": self.batches,
+            "seconds": round(time.monotonic() - self.started, 2),
+        }
+
+
+class _Batch:
+    """Chunks waiting to be embedded together; `done` resolves once they are written to Chroma."""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.sources: List[str] = []
+        self.chars = 0
+        self.done: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def fits(self, chunk: str) -> bool:
+        return not self.ids or (
+            len(self.ids) < EMBED_BATCH_MAX_ITEMS and self.chars + len(chunk) <= EMBED_BATCH_MAX_CHARS
+        )
+
+    def add(self, chunk_id: str, chunk: str, source: str):
+        self.ids.append(chunk_id)
+        self.documents.append(chunk)
+        self.sources.append(source)
+        self.chars += len(chunk)
+
+
+async def ingest_corpus(
+    collection,
+    embedding_model: str,
+    root: str,
+    manifest_file: str = INGEST_MANIFEST_FILE,
+) -> Dict[str, Any]:
+    """
+    Makes the collection hold exactly the chunks of the corpus at `root` (a file or a directory).
+
+    Files are streamed through `iter_chunks`. New chunks are grouped into size-bounded batches
+    that are embedded `INGEST_CONCURRENCY` at a time (as batch-priority work for the LLM
+    scheduler, which applies the rate limit) and upserted into Chroma batch by batch. Chunks
+    already in the collection are skipped, files unchanged since the last run are not re-read,
+    and chunks that are no longer in the corpus are deleted once every file has been read.
+
+    Because every step is idempotent, an interrupted run can simply be started again.
+
+    Returns:
+        Counts of files, chunks added, unchanged and deleted, and the elapsed time.
+    """
+    stored = await asyncio.to_thread(existing_ids, collection)
+    manifest = Manifest(manifest_file)
+    progress = IngestProgress()
+    seen: Set[str] = set()
+    sources: Set[str] = set()
+    slots = asyncio.Semaphore(INGEST_CONCURRENCY)
+    tasks: List[asyncio.Task] = []
+
+    async def write(batch: _Batch):
+        try:
+            with batch_priority():
+                embeddings = await aembed_texts(embedding_model, batch.documents)
+            await asyncio.to_thread(
+                collection.upsert,
+                ids=batch.ids,
+                embeddings=embeddings,
+                documents=batch.documents,
+                metadatas=[{"source": source} for source in batch.sources],
+            )
+        except Exception as e:
+            batch.done.set_exception(e)
+            raise
+        finally:
+            slots.release()
+        batch.done.set_result(None)
+        progress.embedded += len(batch.ids)
+        progress.batches += 1
+        progress.maybe_report()
+
+    async def submit(batch: _Batch):
+        # Waiting for a free slot keeps at most INGEST_CONCURRENCY batches in memory
+        await slots.acquire()
+        tasks.append(asyncio.create_task(write(batch)))
+
+    async def finish_file(source: str, stat: os.stat_result, ids: List[str], pending: List[asyncio.Future]):
+        await asyncio.gather(*pending)
+        manifest.record(source, stat, ids)
+        progress.files_done += 1
+
+    batch = _Batch()
+    for path, source in iter_corpus_files(root):
+        sources.add(source)
+        stat = os.stat(path)
+        previous = manifest.unchanged_ids(source, stat)
+        if previous is not None and stored.issuperset(previous):
+            seen.update(previous)
+            progress.files_done += 1
+            progress.files_skipped += 1
+            progress.chunks += len(previous)
+            progress.unchanged += len(previous)
+            continue
+
+        ids: List[str] = []
+        pending: Dict[int, asyncio.Future] = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for chunk in iter_chunks(f):
+                cid = chunk_id(source, chunk)
+                progress.chunks += 1
+                if cid in seen:
+                    continue
+                seen.add(cid)
+                ids.append(cid)
+                if cid in stored:
+                    progress.unchanged += 1
+                    continue
+                if not batch.fits(chunk):
+                    await submit(batch)
+                    batch = _Batch()
+                batch.add(cid, chunk, source)
+                pending[id(batch)] = batch.done
+        progress.bytes_read += stat.st_size
+        tasks.append(asyncio.create_task(finish_file(source, stat, ids, list(pending.values()))))
+        progress.maybe_report()
+
+    if batch.ids:
+        await submit(batch)
+    else:
+        batch.done.set_result(None)
+    # Re-raise the first failure; the files it affected stay out of the manifest and are retried next run
+    for result in await asyncio.gather(*tasks, return_exceptions=True):
+        if isinstance(result, BaseException):
+            raise result
+
+    stale = sorted(stored - seen)
+    for start in range(0, len(stale), CHROMA_PAGE_SIZE):
+        await asyncio.to_thread(collection.delete, ids=stale[start:start + CHROMA_PAGE_SIZE])
+    progress.deleted = len(stale)
+    manifest.prune(sources)
+    progress.report(final=True)
+    return progress.counts()
@@ -1,15 +1,28 @@
 """This module contains the logic for the Retrieval-Augmented Generation (RAG) system."""
-import chromadb
+import asyncio
+
 from backend.prompts import RAG_PROMPT_TEMPLATE
-from backend.services.llm import client, CHAT_MODEL
+from backend.rag.embedding_cache import aembed_texts
+from backend.rag.semantic_cache import chunk_set_key, lore_answer_cache
+from backend.rag.vector_store import get_collection
+from backend.services.llm import aclient, CHAT_MODEL, EMBEDDING_MODEL
+from backend.services.single_flight import normalize_prompt, single_flight
 
-# Initialize the Chroma DB client and the embedding model
-db_client = chromadb.HttpClient(host="chroma", port=8000)
-embedding_model = "models/embedding-001"
-collection = db_client.get_or_create_collection(name="dnd_lore")
 
+async def ask_rag_question(prompt: str) -> str:
+    """
+    Answers a question about the lore; identical questions asked at the same time share one answer.
 
-def ask_rag_question(prompt: str) -> str:
+    Args:
+        prompt: The user's question.
+
+    Returns:
+        The answer generated by the LLM based on the retrieved context.
+    """
+    return await single_flight.run("lore", normalize_prompt(prompt), lambda: _ask_rag_question(prompt))
+
+
+async def _ask_rag_question(prompt: str) -> str:
     """
     Answers a question using RAG by retrieving relevant context from Chroma DB.
 
@@ -19,26 +32,35 @@ def ask_rag_question(prompt: str) -> str:
     Returns:
         The answer generated by the LLM based on the retrieved context.
     """
-    # 1. Embed the user's prompt
-    prompt_embedding = client.models.embed_content(
-        model=embedding_model,
-        contents=[prompt],
-    ).embeddings[0].values
-
-    # 2. Query the vector database for relevant context
-    results = collection.query(
+    # 1. Embed the user's prompt (repeated questions are served from the embedding cache)
+    prompt_embedding = (await aembed_texts(EMBEDDING_MODEL, [prompt]))[0]
+
+    # 2. Query the vector database for relevant context (the Chroma client is synchronous)
+    collection = await asyncio.to_thread(get_collection)
+    results = await asyncio.to_thread(
+        collection.query,
         query_embeddings=[prompt_embedding],
         n_results=3,
     )
     retrieved_docs = results.get("documents", [[]])[0]
+    retrieved_ids = results.get("ids", [[]])[0]
+
+    # 3. Reuse the answer to a similar question that retrieved the same chunks
+    chunk_key = chunk_set_key(retrieved_ids, retrieved_docs)
+    cached_answer = lore_answer_cache.lookup(prompt_embedding, chunk_key)
+    if cached_answer is not None:
+        return cached_answer
+
     context = "\n".join(retrieved_docs)
 
-    # 3. Construct a new prompt with the retrieved context
+    # 4. Construct a new prompt with the retrieved context
     rag_prompt = RAG_PROMPT_TEMPLATE.format(context=context, prompt=prompt)
 
-    # 4. Call the LLM with the augmented prompt
-    response = client.models.generate_content(
+    # 5. Call the LLM with the augmented prompt
+    response = await aclient.models.generate_content(
         model=CHAT_MODEL,
         contents=rag_prompt,
     )
+    if response.text:
+        lore_answer_cache.store(prompt_embedding, chunk_key, response.text, question=normalize_prompt(prompt))
     return response.text
@@ -0,0 +1,136 @@
+"""A semantic answer cache for the lore keeper."""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import numpy as np
+
+# Minimum cosine similarity between two questions for a cached answer to be reused
+LORE_CACHE_THRESHOLD = float(os.getenv("LORE_CACHE_THRESHOLD", "0.92"))
+# Upper bound on the number of cached answers
+LORE_CACHE_MAX_ENTRIES = int(os.getenv("LORE_CACHE_MAX_ENTRIES", "2048"))
+
+
+def chunk_set_key(ids: Sequence[str], documents: Sequence[str]) -> str:
+    """
+    Identifies a set of retrieved chunks by their ids and their text.
+
+    Hashing the text as well means that re-ingesting the lore with different content
+    produces different keys, so answers built on the old text are never returned.
+    """
+    pairs = sorted(zip(ids, documents))
+    return hashlib.sha256(json.dumps(pairs, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class _Group:
+    """Cached answers that were generated from the same retrieved chunks."""
+
+    def __init__(self, dimensions: int):
+        self.vectors = np.empty((0, dimensions), dtype=np.float32)
+        self.answers: List[str] = []
+        # Normalised text of the questions these answers were generated for
+        self.questions: Set[str] = set()
+
+
+class SemanticCache:
+    """
+    Maps (question embedding, retrieved chunk set) to a generated answer.
+
+    A new question reuses an answer when it retrieved exactly the same chunks and its
+    embedding is within `threshold` cosine similarity of a cached question, so
+    "what are the Sunken Spires?" and "tell me about the sunken spires" share one answer.
+
+    Nothing has to be invalidated when the lore is re-ingested: the chunk set key hashes the
+    retrieved text (see `chunk_set_key`), so changed chunks never match old answers, which
+    simply age out of the LRU.
+    """
+
+    def __init__(self, threshold: float = LORE_CACHE_THRESHOLD, max_entries: int = LORE_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._groups: "OrderedDict[str, _Group]" = OrderedDict()
+        # Normalised question -> chunk set key of its cached answer
+        self._questions: Dict[str, str] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding: Sequence[float], chunk_key: str) -> Optional[str]:
+        """Returns a cached answer for a similar question over the same chunks, if any."""
+        query = self._normalize(embedding)
+        with self._lock:
+            group = self._groups.get(chunk_key)
+            if group is not None and len(group.answers) and group.vectors.shape[1] == query.shape[0]:
+                similarities = group.vectors @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._groups.move_to_end(chunk_key)
+                    self.hits += 1
+                    return group.answers[best]
+            self.misses += 1
+            return None
+
+    def has_question(self, question: str) -> bool:
+        """
+        True if an answer to exactly this (normalised) question is cached.
+
+        Cheap enough to call before deciding how to handle a chat message; the answer itself
+        is still looked up through `lookup`, so it is only reused if the chunks are unchanged.
+        """
+        with self._lock:
+            return question in self._questions
+
+    def store(self, embedding: Sequence[float], chunk_key: str, answer: str, question: Optional[str] = None):
+        """Caches the answer generated for a (normalised) question over a chunk set."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            group = self._groups.get(chunk_key)
+            if group is None or group.vectors.shape[1] != vector.shape[0]:
+                if group is not None:
+                    self._drop(chunk_key, group)
+                group = self._groups[chunk_key] = _Group(vector.shape[0])
+            group.vectors = np.vstack([group.vectors, vector])
+            group.answers.append(answer)
+            if question is not None:
+                group.questions.add(question)
+                self._questions[question] = chunk_key
+            self._groups.move_to_end(chunk_key)
+            self._size += 1
+            # Evict whole groups, least recently used first
+            while self._size > self.max_entries and len(self._groups) > 1:
+                evicted_key, evicted = self._groups.popitem(last=False)
+                self._drop(evicted_key, evicted)
+
+    def _drop(self, chunk_key: str, group: _Group):
+        self._size -= len(group.answers)
+        for question in group.questions:
+            # The question may have been answered again since, over other chunks
+            if self._questions.get(question) == chunk_key:
+                del self._questions[question]
+
+    def stats(self) -> Dict[str, Any]:
+        """Reports hit rate and size of the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "chunk_sets": len(self._groups),
+            "questions": len(self._questions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "threshold": self.threshold,
+        }
+
+
+# Shared by every caller of `ask_rag_question`
+lore_answer_cache = SemanticCache()
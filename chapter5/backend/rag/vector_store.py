@@ -0,0 +1,27 @@
+"""Access to the Chroma collection that holds the lore chunks."""
+import os
+from functools import lru_cache
+
+import chromadb
+
+from backend.services.llm import LLM_BACKEND
+
+LORE_COLLECTION = "dnd_lore"
+# Under the fake backend, Chroma runs in-process on this directory instead of on the
+# "chroma" server, so offline runs need no server and never touch the real vectors
+FAKE_CHROMA_PATH = os.getenv("FAKE_CHROMA_PATH", "chroma_fake")
+
+
+@lru_cache(maxsize=1)
+def get_collection():
+    """
+    Returns the lore collection, connecting on first use.
+
+    Nothing connects at import time, so the API starts (and the agent loop runs) even while
+    Chroma is unreachable; a failed connection is retried on the next call.
+    """
+    if LLM_BACKEND == "fake":
+        db_client = chromadb.PersistentClient(path=FAKE_CHROMA_PATH)
+    else:
+        db_client = chromadb.HttpClient(host="chroma", port=8000)
+    return db_client.get_or_create_collection(name=LORE_COLLECTION)
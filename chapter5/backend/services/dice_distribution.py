@@ -0,0 +1,265 @@
+"""Exact probability distributions of dice expressions, computed by convolution instead of sampling."""
+import math
+import threading
+from collections import OrderedDict
+from functools import lru_cache, wraps
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from backend.services.dice_roller import DiceError, DiceExpression, DiceTerm, parse_dice
+
+# Distributions with more possible totals than this are refused (1000d1000 has about a million)
+DIST_MAX_SUPPORT = 2_000_000
+# Keeping the highest/lowest dice costs about count^2 * faces array operations
+DIST_MAX_KEEP_WORK = 20000
+# The full PMF is returned only when it has at most this many values
+DIST_MAX_PMF_POINTS = 200
+# Exploding dice have an unbounded total; the tail beyond this probability is cut off
+EXPLODE_TAIL_PROBABILITY = 1e-12
+# Above this many points, convolutions use the FFT instead of np.convolve
+FFT_MIN_SIZE = 512
+PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+# Memoised distributions are bounded by size, not count: a single one can be megabytes.
+# Larger ones are recomputed on demand; the total kept is capped in bytes
+DIST_MEMO_MAX_POINTS = 4096
+DIST_MEMO_MAX_BYTES = 16 * 1024 * 1024
+
+# A distribution over integers: the value of the first entry and the probability of each consecutive value
+Pmf = Tuple[int, np.ndarray]
+
+
+def _frozen(probabilities: np.ndarray) -> np.ndarray:
+    # Cached arrays are shared between callers, so they must never be modified
+    probabilities.setflags(write=False)
+    return probabilities
+
+
+class _PmfMemo:
+    """An LRU memo of distributions, bounded by their total `nbytes` and skipping large ones."""
+
+    def __init__(self, max_bytes: int = DIST_MEMO_MAX_BYTES, max_points: int = DIST_MEMO_MAX_POINTS):
+        self.max_bytes = max_bytes
+        self.max_points = max_points
+        self._entries: "OrderedDict[Hashable, Pmf]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Pmf]:
+        with self._lock:
+            pmf = self._entries.get(key)
+            if pmf is not None:
+                self._entries.move_to_end(key)
+            return pmf
+
+    def put(self, key: Hashable, pmf: Pmf):
+        if len(pmf[1]) > self.max_points:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = pmf
+            self._bytes += pmf[1].nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[1].nbytes
+
+
+def _memoized(function: Callable[..., Pmf]) -> Callable[..., Pmf]:
+    """Memoises a function returning a `Pmf` in a size-bounded `_PmfMemo`."""
+    memo = _PmfMemo()
+
+    @wraps(function)
+    def wrapper(*args: Any) -> Pmf:
+        pmf = memo.get(args)
+        if pmf is None:
+            pmf = function(*args)
+            memo.put(args, pmf)
+        return pmf
+
+    return wrapper
+
+
+def convolve(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Convolves two probability vectors, using the FFT when both are large."""
+    if min(len(a), len(b)) < FFT_MIN_SIZE:
+        return np.convolve(a, b)
+    size = len(a) + len(b) - 1
+    n = 1 << (size - 1).bit_length()
+    result = np.fft.irfft(np.fft.rfft(a, n) * np.fft.rfft(b, n), n)[:size]
+    # Round-off can leave tiny negative values; clip them and renormalise
+    np.clip(result, 0, None, out=result)
+    return result / result.sum()
+
+
+@lru_cache(maxsize=256)
+def die_pmf(faces: int, reroll_at_most: int = 0, explode: bool = False) -> Pmf:
+    """The distribution of a single die, after rerolling low results once and exploding."""
+    p = np.full(faces, 1 / faces)
+    if reroll_at_most:
+        # A low first roll is replaced by a second, uniform roll
+        p[:reroll_at_most] = 0
+        p += reroll_at_most / faces / faces
+    if explode:
+        # A maximum adds another (uniform) roll of the same die, which may itself explode,
+        # so a total of k*faces + v (0 < v < faces) needs k maxima followed by a v
+        result = np.zeros(faces)
+        result[:faces - 1] = p[:faces - 1]
+        chain = p[-1]
+        while chain > EXPLODE_TAIL_PROBABILITY:
+            level = np.zeros(faces)
+            level[:faces - 1] = chain / faces
+            result = np.concatenate([result, level])
+            chain /= faces
+        p = result / result.sum()
+    return 1, _frozen(p)
+
+
+@_memoized
+def pool_pmf(faces: int, count: int, reroll_at_most: int = 0, explode: bool = False) -> Pmf:
+    """
+    The distribution of the sum of `count` identical dice, memoised per die and count.
+
+    Uses exponentiation by squaring, so a pool of n dice costs about log2(n) convolutions,
+    each of which reuses the memoised distributions of smaller pools (only small ones are
+    kept, see `DIST_MEMO_MAX_POINTS`).
+    """
+    offset, single = die_pmf(faces, reroll_at_most, explode)
+    if count == 1:
+        return offset, single
+    half_offset, half = pool_pmf(faces, count // 2, reroll_at_most, explode)
+    result = convolve(half, half)
+    if count % 2:
+        result = convolve(result, single)
+    return half_offset * 2 + (offset if count % 2 else 0), _frozen(result)
+
+
+def _keep_pmf(term: DiceTerm) -> Pmf:
+    """
+    The distribution of the sum of the kept highest (or lowest) dice of a pool.
+
+    Values are visited from best to worst; at each value, the number of remaining dice that
+    show it is binomial given that they show no better value. The state is the number of
+    dice placed so far and the distribution of the kept sum.
+    """
+    how, keep = term.keep
+    offset, single = die_pmf(term.faces, term.reroll_at_most, term.explode)
+    values = np.arange(offset, offset + len(single))
+    order = np.argsort(-values if how == "h" else values, kind="stable")
+    values, probabilities = values[order], single[order]
+    width = keep * int(values.max()) + 1
+
+    # states[c] = distribution of the kept sum once c dice have been placed
+    states = {0: np.zeros(width)}
+    states[0][0] = 1.0
+    remaining_mass = 1.0
+    for value, p in zip(values.tolist(), probabilities.tolist()):
+        if p <= 0:
+            continue
+        q = min(1.0, p / remaining_mass) if remaining_mass > 0 else 1.0
+        remaining_mass -= p
+        new_states: Dict[int, np.ndarray] = {}
+        for placed, sums in states.items():
+            left = term.count - placed
+            for j in range(left + 1):
+                weight = math.comb(left, j) * q ** j * (1 - q) ** (left - j)
+                if weight == 0:
+                    continue
+                kept_here = max(0, min(j, keep - placed))
+                shift = kept_here * value
+                target = new_states.setdefault(placed + j, np.zeros(width))
+                if shift:
+                    target[shift:] += weight * sums[:width - shift]
+                else:
+                    target += weight * sums
+        states = new_states
+    total = states.get(term.count, np.zeros(width))
+    nonzero = np.nonzero(total > 0)[0]
+    if not len(nonzero):
+        return 0, _frozen(np.ones(1))
+    low = int(nonzero[0])
+    return low, _frozen(total[low:int(nonzero[-1]) + 1] / total.sum())
+
+
+def term_pmf(term: DiceTerm) -> Pmf:
+    """The distribution of one term, before its sign is applied."""
+    if term.keep is None:
+        return pool_pmf(term.faces, term.count, term.reroll_at_most, term.explode)
+    faces = len(die_pmf(term.faces, term.reroll_at_most, term.explode)[1])
+    if term.count ** 2 * faces > DIST_MAX_KEEP_WORK:
+        raise DiceError(f"{term.notation} is too large a pool for an exact keep/drop distribution.")
+    return _keep_pmf(term)
+
+
+@_memoized
+def expression_pmf(expression: DiceExpression) -> Pmf:
+    """The distribution of the total of a compiled expression."""
+    # Checked before any convolution, from the width of each die's own distribution:
+    # an exploding die spans many times its faces (up to the cut-off tail)
+    support = 1
+    for term in expression.terms:
+        width = len(die_pmf(term.faces, term.reroll_at_most, term.explode)[1])
+        dice = term.keep[1] if term.keep is not None else term.count
+        support += dice * (width - 1)
+    if support > DIST_MAX_SUPPORT:
+        raise DiceError(f"This expression has too many possible totals ({support}) for an exact distribution.")
+
+    offset, result = expression.modifier, np.ones(1)
+    for term in expression.terms:
+        term_offset, probabilities = term_pmf(term)
+        if term.sign < 0:
+            # Subtracting a term mirrors its distribution
+            term_offset, probabilities = -(term_offset + len(probabilities) - 1), probabilities[::-1]
+        offset += term_offset
+        result = convolve(result, probabilities)
+    return offset, _frozen(result)
+
+
+def summarize_pmf(offset: int, probabilities: np.ndarray, target: Optional[int] = None) -> Dict[str, Any]:
+    """Mean, variance, range and percentiles of a distribution (and the chance of reaching `target`)."""
+    values = np.arange(offset, offset + len(probabilities))
+    mean = float(np.dot(values, probabilities))
+    variance = float(np.dot((values - mean) ** 2, probabilities))
+    cdf = np.cumsum(probabilities)
+    summary: Dict[str, Any] = {
+        "mean": round(mean, 4),
+        "variance": round(variance, 4),
+        "std_dev": round(math.sqrt(variance), 4),
+        # Arrays span exactly the possible totals (exploding dice: up to the cut-off tail)
+        "min": int(values[0]),
+        "max": int(values[-1]),
+        "percentiles": {
+            str(q): int(values[min(int(np.searchsorted(cdf, q / 100 - 1e-12)), len(values) - 1)])
+            for q in PERCENTILES
+        },
+    }
+    if target is not None:
+        index = target - offset
+        at_least = 1.0 if index <= 0 else float(probabilities[index:].sum()) if index < len(values) else 0.0
+        summary["target"] = target
+        summary["probability_at_least_target"] = round(min(1.0, at_least), 6)
+    if len(probabilities) <= DIST_MAX_PMF_POINTS:
+        summary["pmf"] = {
+            str(v): round(float(p), 6) for v, p in zip(values, probabilities) if p > 0
+        }
+    return summary
+
+
+def dice_distribution_sync(expression: str, target: Optional[int] = None) -> dict:
+    """
+    Computes the exact distribution of a dice expression.
+
+    Args:
+        expression: A dice expression, e.g. '8d6', '1d20+5 adv' or '4d6kh3'.
+        target: Optional number to beat; reports the probability of rolling at least this total.
+
+    Returns:
+        A dict with the mean, variance, standard deviation, range, percentiles, the
+        probability of reaching `target` and, for small ranges, the full PMF; or an "error".
+    """
+    try:
+        compiled = parse_dice(expression)
+        offset, probabilities = expression_pmf(compiled)
+    except DiceError as e:
+        return {"error": f"Invalid dice expression: {e}"}
+    return {"expression": compiled.notation, **summarize_pmf(offset, probabilities, target)}
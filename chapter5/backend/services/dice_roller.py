@@ -1,11 +1,343 @@
-"""A simple dice roller service."""
-import random
+"""A dice-expression engine: parses notation once, rolls with NumPy and summarises large pools."""
+import os
 import re
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Hard limits, so that a single expression cannot exhaust memory or CPU
+DICE_MAX_COUNT = int(os.getenv("DICE_MAX_COUNT", "1000000"))  # dice in one expression
+DICE_MAX_FACES = int(os.getenv("DICE_MAX_FACES", "10000"))
+DICE_MAX_TERMS = 20
+DICE_MAX_EXPRESSION_LENGTH = 200
+# Keep/drop has to sort the whole pool, so it is limited to smaller pools
+DICE_MAX_KEEP_POOL = 10000
+# An exploding die stops after this many extra rolls
+DICE_MAX_EXPLOSIONS = 100
+# Pools of more dice than this are summarised instead of listed die by die
+DICE_LIST_LIMIT = int(os.getenv("DICE_LIST_LIMIT", "50"))
+# Large pools are rolled this many dice at a time to bound memory
+DICE_BATCH_SIZE = 65536
+# Number of compiled expressions kept
+DICE_COMPILE_CACHE_SIZE = 1024
+# Maximum number of rolls in one bulk request
+DICE_MAX_BULK_ROLLS = 1000
+
+# One term: "4d6kh3", "d20", "2d10!", "3d6r1", "d%", or a constant such as "5"
+TERM_PATTERN = re.compile(r"(?P<count>\d*)d(?P<faces>\d+|%)(?P<modifiers>(?:kh|kl|dh|dl|k|r|!)\d*)*|(?P<constant>\d+)")
+MODIFIER_PATTERN = re.compile(r"(kh|kl|dh|dl|k|r|!)(\d*)")
+SIGNED_TERM_PATTERN = re.compile(r"([+-]?)([^+-]+)")
+ADVANTAGE_PATTERN = re.compile(r"(advantage|adv|disadvantage|dis)$")
+
+
+class DiceError(ValueError):
+    """Raised for dice expressions that cannot be parsed or exceed the limits."""
+
+
+@dataclass(frozen=True)
+class DiceTerm:
+    """
+    One group of identical dice in a compiled expression.
+
+    Args:
+        count: Number of dice rolled.
+        faces: Number of faces of each die.
+        sign: 1 if the term is added, -1 if it is subtracted.
+        keep: `("h", n)` or `("l", n)` to keep only the n highest or lowest dice.
+        explode: A die showing its maximum is rolled again and the new roll added to it.
+        reroll_at_most: Dice showing this value or less are rerolled once.
+    """
+
+    count: int
+    faces: int
+    sign: int = 1
+    keep: Optional[Tuple[str, int]] = None
+    explode: bool = False
+    reroll_at_most: int = 0
+
+    @property
+    def notation(self) -> str:
+        text = f"{self.count}d{self.faces}"
+        if self.reroll_at_most:
+            text += f"r{self.reroll_at_most}"
+        if self.explode:
+            text += "!"
+        if self.keep:
+            text += f"k{self.keep[0]}{self.keep[1]}"
+        return text
+
+
+@dataclass(frozen=True)
+class DiceExpression:
+    """A parsed dice expression: a sum of dice terms plus a constant modifier."""
+
+    terms: Tuple[DiceTerm, ...]
+    modifier: int = 0
+
+    @property
+    def notation(self) -> str:
+        text = ""
+        for term in self.terms:
+            if text or term.sign < 0:
+                text += "-" if term.sign < 0 else "+"
+            text += term.notation
+        if self.modifier or not text:
+            text += f"{self.modifier:+d}" if text else str(self.modifier)
+        return text
+
+    @property
+    def dice_count(self) -> int:
+        return sum(term.count for term in self.terms)
+
+
+@dataclass
+class TermRoll:
+    """The outcome of one term: the kept dice (when few enough to list) and their sum."""
+
+    term: DiceTerm
+    total: int
+    dice: Optional[List[int]] = None
+    dropped: Optional[List[int]] = None
+
+
+@dataclass
+class RollResult:
+    """The outcome of rolling a whole expression."""
+
+    expression: DiceExpression
+    terms: List[TermRoll]
+    total: int
+
+
+def _parse_term(text: str, sign: int) -> Tuple[Optional[DiceTerm], int]:
+    """Parses one unsigned term; returns the dice term, or None and the constant."""
+    match = TERM_PATTERN.fullmatch(text)
+    if not match:
+        raise DiceError(f"Cannot parse dice term {text!r}.")
+    if match.group("constant") is not None:
+        return None, sign * int(match.group("constant"))
+
+    count = int(match.group("count") or 1)
+    faces = 100 if match.group("faces") == "%" else int(match.group("faces"))
+    if not 1 <= count <= DICE_MAX_COUNT:
+        raise DiceError(f"Dice count must be between 1 and {DICE_MAX_COUNT}.")
+    if not 1 <= faces <= DICE_MAX_FACES:
+        raise DiceError(f"Dice must have between 1 and {DICE_MAX_FACES} faces.")
+
+    keep, explode, reroll_at_most = None, False, 0
+    modifiers = text[text.index("d") + len(match.group("faces")) + 1:]
+    for name, value in MODIFIER_PATTERN.findall(modifiers):
+        if name == "!":
+            if value:
+                raise DiceError("Exploding dice ('!') take no number.")
+            if faces == 1:
+                raise DiceError("A one-sided die cannot explode.")
+            explode = True
+        elif name == "r":
+            reroll_at_most = int(value or 1)
+            if reroll_at_most >= faces:
+                raise DiceError(f"Cannot reroll every face of a d{faces}.")
+        else:
+            if keep is not None:
+                raise DiceError("Use at most one keep/drop modifier per term.")
+            n = int(value or 1)
+            if not 0 <= n <= count:
+                raise DiceError(f"Cannot keep or drop {n} of {count} dice.")
+            if count > DICE_MAX_KEEP_POOL:
+                raise DiceError(f"Keep/drop is limited to pools of {DICE_MAX_KEEP_POOL} dice.")
+            # Dropping the n lowest is keeping the count - n highest, and vice versa
+            keep = {"kh": ("h", n), "k": ("h", n), "kl": ("l", n), "dl": ("h", count - n), "dh": ("l", count - n)}[name]
+    return DiceTerm(count, faces, sign, keep, explode, reroll_at_most), 0
+
+
+@lru_cache(maxsize=DICE_COMPILE_CACHE_SIZE)
+def _compile(text: str) -> DiceExpression:
+    advantage = ADVANTAGE_PATTERN.search(text)
+    if advantage:
+        text = text[:advantage.start()]
+    if not text:
+        raise DiceError("Empty dice expression.")
+
+    matches = list(SIGNED_TERM_PATTERN.finditer(text))
+    if "".join(m.group(0) for m in matches) != text or any(m.group(1) == "" for m in matches[1:]):
+        raise DiceError(f"Cannot parse dice expression {text!r}.")
+    if len(matches) > DICE_MAX_TERMS:
+        raise DiceError(f"Use at most {DICE_MAX_TERMS} terms.")
+
+    terms: List[DiceTerm] = []
+    modifier = 0
+    for match in matches:
+        term, constant = _parse_term(match.group(2), -1 if match.group(1) == "-" else 1)
+        if term is None:
+            modifier += constant
+        else:
+            terms.append(term)
+
+    if advantage:
+        # Advantage rolls each single d20 twice and keeps the higher (disadvantage: the lower)
+        keep = ("l", 1) if advantage.group(1).startswith("dis") else ("h", 1)
+        d20s = [i for i, t in enumerate(terms) if t.faces == 20 and t.count == 1 and t.keep is None]
+        if not d20s:
+            raise DiceError("Advantage and disadvantage apply to a single d20, e.g. 'd20+5 adv'.")
+        for i in d20s:
+            t = terms[i]
+            terms[i] = DiceTerm(2, 20, t.sign, keep, t.explode, t.reroll_at_most)
+
+    if not terms:
+        raise DiceError("Roll at least one die, e.g. '1d20'.")
+    expression = DiceExpression(tuple(terms), modifier)
+    if expression.dice_count > DICE_MAX_COUNT:
+        raise DiceError(f"An expression may roll at most {DICE_MAX_COUNT} dice.")
+    return expression
+
+
+def parse_dice(dice_string: str) -> DiceExpression:
+    """
+    Parses a dice expression, reusing the compiled form of expressions seen before.
+
+    Supports sums of terms like `2d6+1d4+3`, keep/drop (`4d6kh3`, `4d6dl1`, `2d20kl1`),
+    exploding dice (`3d6!`), rerolling low results once (`2d6r2`), percentile dice (`d%`)
+    and advantage or disadvantage on a d20 (`d20+5 adv`).
+
+    Raises:
+        DiceError: If the expression is invalid or exceeds the limits.
+    """
+    if len(dice_string) > DICE_MAX_EXPRESSION_LENGTH:
+        raise DiceError(f"Dice expressions are limited to {DICE_MAX_EXPRESSION_LENGTH} characters.")
+    return _compile("".join(dice_string.lower().split()))
+
+
+# NumPy generators are not thread-safe, and rolls run in worker threads
+_local = threading.local()
+
+
+def _rng() -> np.random.Generator:
+    if not hasattr(_local, "rng"):
+        _local.rng = np.random.default_rng()
+    return _local.rng
+
+
+def roll_pool(term: DiceTerm, shape: Tuple[int, ...], rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """Rolls dice of a term (rerolls and explosions applied, keep/drop not) into an array of `shape`."""
+    rng = rng or _rng()
+    values = rng.integers(1, term.faces + 1, size=shape, dtype=np.int64)
+    if term.reroll_at_most:
+        low = values <= term.reroll_at_most
+        values[low] = rng.integers(1, term.faces + 1, size=int(low.sum()), dtype=np.int64)
+    if term.explode:
+        exploding = values == term.faces
+        for _ in range(DICE_MAX_EXPLOSIONS):
+            n = int(exploding.sum())
+            if not n:
+                break
+            extra = rng.integers(1, term.faces + 1, size=n, dtype=np.int64)
+            values[exploding] += extra
+            # Only the dice whose extra roll was also a maximum keep exploding
+            exploding[exploding] = extra == term.faces
+    return values
+
+
+def _apply_keep(term: DiceTerm, values: np.ndarray) -> np.ndarray:
+    """Keeps the highest or lowest dice of each row, sorted in descending order."""
+    ordered = -np.sort(-values, axis=-1)
+    if term.keep is None:
+        return ordered
+    how, n = term.keep
+    return ordered[..., :n] if how == "h" else ordered[..., ordered.shape[-1] - n:]
+
+
+def term_totals(term: DiceTerm, repeats: int = 1, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    Rolls a term `repeats` times and returns the signed total of each roll.
+
+    Large pools without keep/drop are rolled `DICE_BATCH_SIZE` dice at a time, so memory
+    stays bounded whatever the dice count.
+    """
+    rng = rng or _rng()
+    if term.keep is not None:
+        return term.sign * _apply_keep(term, roll_pool(term, (repeats, term.count), rng)).sum(axis=-1)
+    totals = np.zeros(repeats, dtype=np.int64)
+    rows = max(1, DICE_BATCH_SIZE // term.count)
+    columns = min(term.count, DICE_BATCH_SIZE)
+    for row in range(0, repeats, rows):
+        height = min(rows, repeats - row)
+        for column in range(0, term.count, columns):
+            width = min(columns, term.count - column)
+            totals[row:row + height] += roll_pool(term, (height, width), rng).sum(axis=-1)
+    return term.sign * totals
+
+
+def roll_expression(expression: DiceExpression, rng: Optional[np.random.Generator] = None) -> RollResult:
+    """Rolls a compiled expression once, listing the dice of small pools."""
+    rng = rng or _rng()
+    rolls = []
+    for term in expression.terms:
+        if term.count > DICE_LIST_LIMIT:
+            rolls.append(TermRoll(term, int(term_totals(term, 1, rng)[0])))
+            continue
+        values = roll_pool(term, (term.count,), rng)
+        kept = _apply_keep(term, values) if term.keep else values
+        dice = [int(v) for v in kept]
+        dropped = None
+        if term.keep:
+            remaining = list(values)
+            for v in kept:
+                remaining.remove(v)
+            dropped = [int(v) for v in remaining]
+        rolls.append(TermRoll(term, term.sign * sum(dice), dice, dropped))
+    total = sum(r.total for r in rolls) + expression.modifier
+    return RollResult(expression, rolls, total)
+
+
+def roll_totals(expression: DiceExpression, repeats: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """Rolls a compiled expression `repeats` times in one vectorised pass and returns the totals."""
+    rng = rng or _rng()
+    totals = np.full(repeats, expression.modifier, dtype=np.int64)
+    for term in expression.terms:
+        totals += term_totals(term, repeats, rng)
+    return totals
+
+
+def _describe_term(roll: TermRoll) -> str:
+    if roll.dice is None:
+        if roll.term.keep:
+            return f"{roll.term.notation} [{roll.term.count} dice, kept {roll.term.keep[1]}, sum {abs(roll.total)}]"
+        mean = abs(roll.total) / roll.term.count
+        return f"{roll.term.notation} [{roll.term.count} dice, mean {mean:.2f}, sum {abs(roll.total)}]"
+    text = f"{roll.term.notation} {roll.dice}"
+    if roll.dropped:
+        text += f" (dropped {roll.dropped})"
+    return text
+
+
+def format_roll(result: RollResult) -> str:
+    """Formats a roll for the model and the UI, e.g. 'Rolled 4d6kh3 [6, 5, 3] (dropped [1]) + 2 = 16'."""
+    modifier = result.expression.modifier
+    terms = result.terms
+    # Plain "NdS+M" rolls keep their original, shorter format
+    if len(terms) == 1 and terms[0].dice is not None and terms[0].term.sign > 0 and terms[0].term.notation == (
+        f"{terms[0].term.count}d{terms[0].term.faces}"
+    ):
+        text = f"Rolled {terms[0].dice}"
+    else:
+        text = "Rolled "
+        for i, roll in enumerate(terms):
+            if i:
+                text += " - " if roll.term.sign < 0 else " + "
+            elif roll.term.sign < 0:
+                text += "-"
+            text += _describe_term(roll)
+    if modifier:
+        text += f" {'+' if modifier > 0 else '-'} {abs(modifier)}"
+    return f"{text} = {result.total}"
 
 
 def roll_dice_sync(dice_string: str) -> str:
     """
-    Rolls dice based on a standard dice notation string (e.g., '2d6', '1d20+5').
+    Rolls dice based on a dice expression (e.g., '2d6', '1d20+5', '4d6kh3', 'd20+3 adv').
 
     Args:
         dice_string: The dice notation string.
@@ -14,25 +346,91 @@ def roll_dice_sync(dice_string: str) -> str:
         The result of the dice roll as a string.
     """
     try:
-        # Regex to parse the dice string, e.g., "2d6+3"
-        match = re.match(r"(\d+)d(\d+)([+-]\d+)?", dice_string.lower().strip())
-        if not match:
-            return "Invalid dice format. Please use a format like '2d6' or '1d20+3'."
+        return format_roll(roll_expression(parse_dice(dice_string)))
+    except DiceError as e:
+        return f"Invalid dice expression: {e} Use a format like '2d6', '1d20+3' or '4d6kh3'."
+    except Exception as e:
+        return f"Error rolling dice: {e}"
+
 
-        num_dice = int(match.group(1))
-        num_sides = int(match.group(2))
-        modifier_str = match.group(3)
+def roll_dice_many_sync(
+    rolls: Optional[Sequence[Dict[str, Any]]] = None,
+    expression: Optional[str] = None,
+    count: int = 1,
+    target: Optional[int] = None,
+) -> dict:
+    """
+    Rolls many labelled expressions at once, e.g. initiative for a whole encounter or a volley of attacks.
 
-        modifier = 0
-        if modifier_str:
-            modifier = int(modifier_str)
+    Rolls that share an expression are rolled together in one vectorised pass.
 
-        rolls = [random.randint(1, num_sides) for _ in range(num_dice)]
-        total = sum(rolls) + modifier
+    Args:
+        rolls: A list of `{"label", "expression"}` items.
+        expression: Alternatively, one expression to roll `count` times (labelled "1", "2", ...).
+        count: Number of rolls of `expression`.
+        target: Optional number to reach, such as an AC; hits are totals at or above it.
 
-        if modifier != 0:
-            return f"Rolled {rolls} + {modifier} = {total}"
-        return f"Rolled {rolls} = {total}"
+    Returns:
+        A dict with each roll's total, the labels in initiative order (highest first, ties in
+        request order), summary statistics and, with a target, the hits; or an "error".
+    """
+    # Tool calls bypass the REST model's validation, so sizes are checked before anything is built
+    if rolls:
+        if len(rolls) > DICE_MAX_BULK_ROLLS:
+            return {"error": f"At most {DICE_MAX_BULK_ROLLS} rolls per request."}
+        if not all(isinstance(item, dict) for item in rolls):
+            return {"error": "Each roll must be an object with a 'label' and an 'expression'."}
+        items = [(str(item.get("label") or i + 1), str(item.get("expression", ""))) for i, item in enumerate(rolls)]
+    elif expression:
+        try:
+            count = int(count)
+        except (TypeError, ValueError):
+            return {"error": "'count' must be a whole number."}
+        if not 1 <= count <= DICE_MAX_BULK_ROLLS:
+            return {"error": f"'count' must be between 1 and {DICE_MAX_BULK_ROLLS}."}
+        items = [(str(i + 1), expression) for i in range(count)]
+    else:
+        return {"error": "Provide either 'rolls' or 'expression'."}
 
-    except Exception as e:
-        return f"Error rolling dice: {e}"
+    # Group the rolls by compiled expression so that each distinct expression is rolled once, vectorised
+    groups: Dict[DiceExpression, List[int]] = {}
+    try:
+        for index, (_, text) in enumerate(items):
+            groups.setdefault(parse_dice(text), []).append(index)
+    except DiceError as e:
+        return {"error": f"Invalid dice expression: {e}"}
+    if sum(compiled.dice_count * len(indices) for compiled, indices in groups.items()) > DICE_MAX_COUNT:
+        return {"error": f"A bulk roll may roll at most {DICE_MAX_COUNT} dice in total."}
+
+    totals = np.zeros(len(items), dtype=np.int64)
+    notations = [""] * len(items)
+    for compiled, indices in groups.items():
+        totals[indices] = roll_totals(compiled, len(indices))
+        for index in indices:
+            notations[index] = compiled.notation
+
+    labels = [label for label, _ in items]
+    order = np.argsort(-totals, kind="stable")
+    result: Dict[str, Any] = {
+        "results": [
+            {"label": label, "expression": notation, "total": int(total)}
+            for label, notation, total in zip(labels, notations, totals)
+        ],
+        "order": [labels[i] for i in order],
+        "summary": {
+            "count": len(items),
+            "sum": int(totals.sum()),
+            "mean": round(float(totals.mean()), 2),
+            "min": int(totals.min()),
+            "max": int(totals.max()),
+        },
+    }
+    if target is not None:
+        hit = totals >= target
+        result["hits"] = {
+            "target": target,
+            "hits": int(hit.sum()),
+            "misses": int(len(items) - hit.sum()),
+            "hit_labels": [label for label, h in zip(labels, hit) if h],
+        }
+    return result
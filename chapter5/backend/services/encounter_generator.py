@@ -3,10 +3,12 @@ import json
 from typing import Dict, Any
 
 from backend.prompts import ENCOUNTER_PROMPT_TEMPLATE
-from backend.services.llm import client, json_generation_config, CHAT_MODEL
+from backend.services.llm import aclient, json_generation_config, CHAT_MODEL
+from backend.services.response_cache import make_key, response_cache
+from backend.services.single_flight import normalize_prompt, single_flight
 
 
-def generate_encounter_details(prompt: str) -> Dict[str, Any]:
+async def _generate_encounter_details(prompt: str) -> Dict[str, Any]:
     """
     Generates structured encounter details based on a prompt using a JSON-configured LLM.
 
@@ -20,7 +22,7 @@ def generate_encounter_details(prompt: str) -> Dict[str, Any]:
     full_prompt = ENCOUNTER_PROMPT_TEMPLATE.format(prompt=prompt)
 
     # 2. Generate the content
-    response = client.models.generate_content(
+    response = await aclient.models.generate_content(
         model=CHAT_MODEL,
         contents=full_prompt,
         config=json_generation_config,
@@ -33,3 +35,30 @@ def generate_encounter_details(prompt: str) -> Dict[str, Any]:
     except (json.JSONDecodeError, AttributeError) as e:
         print(f"Error parsing JSON from LLM response: {e}")
         return {"error": "Failed to generate encounter details due to a JSON parsing error."}
+
+
+async def generate_encounter_details(prompt: str, fresh: bool = False) -> Dict[str, Any]:
+    """
+    Returns structured encounter details for a prompt, reusing a cached generation when one exists.
+
+    Args:
+        prompt: The user's prompt describing the desired encounter.
+        fresh: Skip the cache and generate a new variation.
+
+    Returns:
+        A dictionary containing the structured details of the encounter.
+    """
+    def cached_generation():
+        return response_cache.get_or_compute(
+            "encounter",
+            make_key(CHAT_MODEL, ENCOUNTER_PROMPT_TEMPLATE, prompt),
+            lambda: _generate_encounter_details(prompt),
+            fresh=fresh,
+            cacheable=lambda details: "error" not in details,
+        )
+
+    if fresh:
+        # A caller asking for a new variation must not share someone else's
+        return await cached_generation()
+    # Identical requests arriving together share one lookup and generation
+    return await single_flight.run("encounter", normalize_prompt(prompt), cached_generation)
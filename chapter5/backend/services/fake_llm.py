@@ -0,0 +1,244 @@
+"""An in-process, deterministic stand-in for the GenAI client, for load tests and offline benchmarks."""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from google.genai import types
+
+# Simulated latency of a generation call, in milliseconds
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "0"))
+# Simulated latency of an embedding call, in milliseconds
+FAKE_EMBED_LATENCY_MS = float(os.getenv("FAKE_EMBED_LATENCY_MS", "0"))
+# Shape of the latency distribution: fixed, uniform, exponential or lognormal
+FAKE_LLM_LATENCY_DISTRIBUTION = os.getenv("FAKE_LLM_LATENCY_DISTRIBUTION", "fixed")
+# Spread of the lognormal distribution (sigma of the underlying normal)
+FAKE_LLM_LATENCY_SIGMA = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.5"))
+# Optional JSON file with extra rules: [{"match": "<regex>", "call": "<tool>", "args": {...}}]
+FAKE_LLM_SCRIPT = os.getenv("FAKE_LLM_SCRIPT")
+FAKE_LLM_SEED = os.getenv("FAKE_LLM_SEED")
+EMBEDDING_DIMENSIONS = 768
+
+DICE_PATTERN = re.compile(r"\b\d+d\d+(?:\s*[+-]\s*\d+)?\b", re.IGNORECASE)
+
+# Default rules, checked in order against the latest user prompt. "{match}" and "{prompt}" in
+# args are replaced by the matched text and by the whole prompt.
+DEFAULT_RULES = [
+    {"match": DICE_PATTERN.pattern, "call": "roll_dice", "args": {"dice_string": "{match}"}},
+    {"match": r"\b(npc|character|innkeeper|tavern keeper|blacksmith)\b", "call": "generate_npc", "args": {"prompt": "{prompt}"}},
+    {"match": r"\b(encounter|ambush|combat|fight)\b", "call": "generate_encounter", "args": {"prompt": "{prompt}"}},
+    {"match": r"\b(lore|what is|what are|who is|tell me about)\b", "call": "ask_lore_keeper", "args": {"prompt": "{prompt}"}},
+]
+
+FAKE_NPC = {
+    "name": "Brakka Ironhand",
+    "race": "Orc",
+    "vocation": "Blacksmith",
+    "personality": "Gruff but fair.",
+    "backstory": "Forged weapons for a mercenary company before settling in town.",
+    "motivations": "Pay off an old debt.",
+    "role_in_story": "Supplies the party and knows rumours from the road.",
+}
+
+FAKE_ENCOUNTER = {
+    "title": "Goblin Ambush",
+    "description": "Goblins spring from the brush along the road.",
+    "monsters": [
+        {"name": "Goblin", "challenge_rating": "1/4", "description": "Small and sneaky."},
+        {"name": "Goblin Boss", "challenge_rating": "1", "description": "Leads from the back."},
+    ],
+    "tactics": "Shoot from cover, flee when the boss falls.",
+    "terrain": "Dense undergrowth on both sides of a muddy road.",
+}
+
+
+def _load_rules() -> List[Dict[str, Any]]:
+    rules = list(DEFAULT_RULES)
+    if FAKE_LLM_SCRIPT:
+        with open(FAKE_LLM_SCRIPT, "r", encoding="utf-8") as f:
+            rules = json.load(f) + rules
+    return [{**rule, "pattern": re.compile(rule["match"], re.IGNORECASE)} for rule in rules]
+
+
+class LatencyModel:
+    """Draws simulated call latencies (in seconds) from a configurable distribution."""
+
+    def __init__(self, mean_ms: float, distribution: str = FAKE_LLM_LATENCY_DISTRIBUTION, rng: Optional[random.Random] = None):
+        if distribution not in ("fixed", "uniform", "exponential", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {distribution!r}")
+        self.mean = mean_ms / 1000
+        self.distribution = distribution
+        self.rng = rng or random.Random()
+
+    def sample(self) -> float:
+        if self.mean <= 0:
+            return 0.0
+        if self.distribution == "uniform":
+            return self.rng.uniform(0, 2 * self.mean)
+        if self.distribution == "exponential":
+            return self.rng.expovariate(1 / self.mean)
+        if self.distribution == "lognormal":
+            # Choose mu so that the distribution's mean equals `self.mean`
+            mu = math.log(self.mean) - FAKE_LLM_LATENCY_SIGMA ** 2 / 2
+            return self.rng.lognormvariate(mu, FAKE_LLM_LATENCY_SIGMA)
+        return self.mean
+
+
+def _part_fields(part: Any) -> Tuple[Optional[str], Any]:
+    """Returns (text, function_response) of a part given as a dict or a `types.Part`."""
+    if isinstance(part, dict):
+        return part.get("text"), part.get("functionResponse") or part.get("function_response")
+    return getattr(part, "text", None), getattr(part, "function_response", None)
+
+
+def _last_message(contents: Any) -> Tuple[str, List[Any]]:
+    """Returns (role, parts) of the last message in any accepted `contents` shape."""
+    if isinstance(contents, str):
+        return "user", [{"text": contents}]
+    if not isinstance(contents, list):
+        contents = [contents]
+    last = contents[-1] if contents else {"role": "user", "parts": []}
+    if isinstance(last, str):
+        return "user", [{"text": last}]
+    if isinstance(last, dict):
+        return last.get("role", "user"), list(last.get("parts", []))
+    return getattr(last, "role", "user") or "user", list(getattr(last, "parts", []) or [])
+
+
+def _prompt_text(contents: Any) -> str:
+    return "\n".join(text for text, _ in map(_part_fields, _last_message(contents)[1]) if text)
+
+
+def _make_response(parts: List[types.Part]) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=parts), finish_reason="STOP")]
+    )
+
+
+def fake_embedding(text: str) -> List[float]:
+    """A deterministic bag-of-words embedding: texts sharing words get similar vectors."""
+    vector = [0.0] * EMBEDDING_DIMENSIONS
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % EMBEDDING_DIMENSIONS
+        vector[index] += 1.0 if digest[4] % 2 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class FakeModels:
+    """Implements the subset of `client.models` used by the app, without network calls."""
+
+    def __init__(self):
+        self.rng = random.Random(FAKE_LLM_SEED)
+        self.rules = _load_rules()
+        self.generate_latency = LatencyModel(FAKE_LLM_LATENCY_MS, rng=self.rng)
+        self.embed_latency = LatencyModel(FAKE_EMBED_LATENCY_MS, rng=self.rng)
+        self.calls = 0
+
+    def _respond(self, contents: Any, config: Any) -> types.GenerateContentResponse:
+        self.calls += 1
+        config = config or types.GenerateContentConfig()
+        if isinstance(config, dict):
+            config = types.GenerateContentConfig(**config)
+        prompt = _prompt_text(contents)
+
+        if config.response_mime_type == "application/json":
+            if "Non-Player Character" in prompt:
+                payload = FAKE_NPC
+            elif "combat encounter" in prompt:
+                payload = FAKE_ENCOUNTER
+            else:
+                payload = {"result": "ok"}
+            return _make_response([types.Part(text=json.dumps(payload))])
+
+        tools_allowed = bool(config.tools)
+        calling_config = config.tool_config.function_calling_config if config.tool_config else None
+        if calling_config is not None and calling_config.mode == "NONE":
+            tools_allowed = False
+
+        _, parts = _last_message(contents)
+        responses = [fr for _, fr in map(_part_fields, parts) if fr]
+        if tools_allowed and not responses:
+            for rule in self.rules:
+                match = rule["pattern"].search(prompt)
+                if match:
+                    args = {
+                        key: value.replace("{match}", match.group(0)).replace("{prompt}", prompt)
+                        if isinstance(value, str) else value
+                        for key, value in rule.get("args", {}).items()
+                    }
+                    return _make_response([types.Part(function_call=types.FunctionCall(name=rule["call"], args=args))])
+
+        if responses:
+            names = ", ".join(fr["name"] if isinstance(fr, dict) else fr.name for fr in responses)
+            text = f"Here is what I found using {names}."
+        else:
+            text = f"(fake model) You said: {prompt[:200]}"
+        return _make_response([types.Part(text=text)])
+
+    def generate_content(self, *, model: str, contents: Any, config: Any = None) -> types.GenerateContentResponse:
+        time.sleep(self.generate_latency.sample())
+        return self._respond(contents, config)
+
+    def embed_content(self, *, model: str, contents: Any, config: Any = None) -> types.EmbedContentResponse:
+        time.sleep(self.embed_latency.sample())
+        texts = [contents] if isinstance(contents, str) else list(contents)
+        return types.EmbedContentResponse(
+            embeddings=[types.ContentEmbedding(values=fake_embedding(str(text))) for text in texts]
+        )
+
+
+class FakeAsyncModels:
+    """Async counterpart of `FakeModels`, mirroring `client.aio.models`."""
+
+    def __init__(self, models: FakeModels):
+        self._models = models
+
+    async def generate_content(self, *, model: str, contents: Any, config: Any = None) -> types.GenerateContentResponse:
+        await asyncio.sleep(self._models.generate_latency.sample())
+        return self._models._respond(contents, config)
+
+    async def generate_content_stream(
+        self, *, model: str, contents: Any, config: Any = None
+    ) -> AsyncIterator[types.GenerateContentResponse]:
+        latency = self._models.generate_latency.sample()
+        response = self._models._respond(contents, config)
+        part = response.candidates[0].content.parts[0]
+
+        async def chunks():
+            if not part.text:
+                await asyncio.sleep(latency)
+                yield response
+                return
+            words = part.text.split(" ")
+            for i, word in enumerate(words):
+                await asyncio.sleep(latency / len(words))
+                yield _make_response([types.Part(text=word if i == 0 else " " + word)])
+
+        return chunks()
+
+    async def embed_content(self, *, model: str, contents: Any, config: Any = None) -> types.EmbedContentResponse:
+        await asyncio.sleep(self._models.embed_latency.sample())
+        texts = [contents] if isinstance(contents, str) else list(contents)
+        return types.EmbedContentResponse(
+            embeddings=[types.ContentEmbedding(values=fake_embedding(str(text))) for text in texts]
+        )
+
+
+class FakeAsyncClient:
+    def __init__(self, models: FakeModels):
+        self.models = FakeAsyncModels(models)
+
+
+class FakeClient:
+    """Drop-in replacement for `genai.Client` with scripted tool calls, canned JSON and hashed embeddings."""
+
+    def __init__(self):
+        self.models = FakeModels()
+        self.aio = FakeAsyncClient(self.models)
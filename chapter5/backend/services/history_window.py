@@ -0,0 +1,154 @@
+"""Builds the token-budgeted history window that the chat agent sends to the model."""
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from backend.database.async_database import load_history, save_summary
+from backend.database.history_cache import filter_message_for_api, history_cache
+from backend.prompts import SUMMARY_PROMPT_TEMPLATE
+from backend.services.llm import aclient, CHAT_MODEL
+
+# Approximate number of tokens of history sent to the model on each call
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "8000"))
+# Number of most recent turns that are always kept verbatim (budget permitting)
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "6"))
+# Older turns are folded into the summary in chunks rather than one per turn: the verbatim
+# window may grow by up to this many extra turns, and a fold shrinks it back to
+# HISTORY_KEEP_TURNS turns within HISTORY_FOLD_TARGET_TOKENS
+HISTORY_FOLD_TURNS = int(os.getenv("HISTORY_FOLD_TURNS", "4"))
+HISTORY_FOLD_TARGET_TOKENS = int(os.getenv("HISTORY_FOLD_TARGET_TOKENS", str(HISTORY_TOKEN_BUDGET // 2)))
+# Rough characters-per-token ratio used to estimate sizes without calling the API
+CHARS_PER_TOKEN = 4
+# Tool outputs are cut to this many characters when rendered for the summariser
+MAX_RENDERED_TOOL_CHARS = 1500
+
+
+def filter_history_for_api(messages: list[dict]) -> list[dict]:
+    """Filters persisted messages to only API-acceptable parts (text, functionResponse)."""
+    safe_history: list[dict] = []
+    for msg in messages:
+        filtered = filter_message_for_api(msg)
+        if filtered is not None:
+            safe_history.append({"role": filtered["role"], "parts": filtered["parts"]})
+    return safe_history
+
+
+def estimate_tokens(message: Dict[str, Any]) -> int:
+    """Estimates the number of tokens a persisted message costs when sent to the model."""
+    return len(json.dumps(message.get("parts", []))) // CHARS_PER_TOKEN + 1
+
+
+def _is_turn_start(message: Dict[str, Any]) -> bool:
+    """A turn starts with a user message that carries text (tool responses are also sent as 'user')."""
+    return message.get("role") == "user" and any("text" in part for part in message.get("parts", []))
+
+
+def split_into_turns(messages: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Groups messages into turns, each starting with a user prompt."""
+    turns: List[List[Dict[str, Any]]] = []
+    for message in messages:
+        if _is_turn_start(message) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def render_for_summary(messages: List[Dict[str, Any]]) -> str:
+    """Renders persisted messages as plain text for the summariser."""
+    lines = []
+    for message in messages:
+        speaker = "GM" if message.get("role") == "user" else "Assistant"
+        for part in message.get("parts", []):
+            if "text" in part:
+                lines.append(f"{speaker}: {part['text']}")
+            elif "functionCall" in part:
+                fc = part["functionCall"]
+                lines.append(f"Assistant called {fc['name']}({json.dumps(fc.get('args', {}))})")
+            elif "functionResponse" in part:
+                fr = part["functionResponse"]
+                output = json.dumps(fr.get("response", {}))[:MAX_RENDERED_TOOL_CHARS]
+                lines.append(f"Tool {fr['name']} returned: {output}")
+    return "\n".join(lines)
+
+
+async def summarize(previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+    """Folds new messages into the previous summary with one LLM call."""
+    prompt = SUMMARY_PROMPT_TEMPLATE.format(
+        summary=previous_summary or "(none yet)",
+        messages=render_for_summary(messages),
+    )
+    response = await aclient.models.generate_content(
+        model=CHAT_MODEL,
+        contents=prompt,
+    )
+    return (response.text or "").strip()
+
+
+def select_window(
+    turns: List[List[Dict[str, Any]]],
+    keep_turns: int = HISTORY_KEEP_TURNS,
+    token_budget: int = HISTORY_TOKEN_BUDGET,
+) -> int:
+    """
+    Chooses how many of the most recent turns to keep verbatim.
+
+    At most `keep_turns` turns are kept, fewer if they do not fit in `token_budget`,
+    but the latest turn is always kept.
+
+    Returns:
+        The index of the first turn in the window.
+    """
+    start = len(turns)
+    used = 0
+    while start > 0 and len(turns) - start < keep_turns:
+        cost = sum(estimate_tokens(m) for m in turns[start - 1])
+        if used + cost > token_budget and start < len(turns):
+            break
+        used += cost
+        start -= 1
+    return start
+
+
+async def build_history(thread_id: str) -> List[Dict[str, Any]]:
+    """
+    Returns the API history for a thread: a rolling summary plus the most recent turns verbatim.
+
+    Only messages newer than the stored summary are loaded (and usually come from the history
+    cache). Turns are kept verbatim until they no longer fit in `HISTORY_KEEP_TURNS +
+    HISTORY_FOLD_TURNS` turns or the token budget; then every turn outside the regular window
+    is folded into the summary at once, so summarising costs one LLM call every few turns
+    rather than one per turn. The summary is persisted, so each message is summarised once.
+    If summarising fails or returns nothing, the summary is left untouched, the older turns
+    are dropped from this request, and they are folded on the next one.
+    """
+    cached = await load_history(thread_id)
+    summary: Optional[str] = cached.summary
+
+    turns = split_into_turns(list(cached.messages))
+    start = select_window(turns, HISTORY_KEEP_TURNS + HISTORY_FOLD_TURNS)
+    if start > 0:
+        # The window overflowed: shrink it back to leave room for the next few turns
+        start = select_window(turns, HISTORY_KEEP_TURNS, HISTORY_FOLD_TARGET_TOKENS)
+
+    to_fold = [m for turn in turns[:start] for m in turn]
+    if to_fold:
+        # Everything before the first message of the window is now covered by the summary
+        summary_cursor = turns[start][0]["id"] - 1
+        try:
+            folded = await summarize(summary or "", to_fold)
+            if not folded:
+                raise ValueError("the summariser returned an empty summary")
+            await save_summary(thread_id, folded, summary_cursor)
+            history_cache.fold(thread_id, folded, summary_cursor)
+            summary = folded
+        except Exception as e:
+            print(f"Error summarising history for thread {thread_id}: {e}")
+
+    history = filter_history_for_api([m for turn in turns[start:] for m in turn])
+    if summary:
+        summary_part = {"text": f"Summary of the earlier conversation:\n{summary}"}
+        if history and history[0]["role"] == "user":
+            history[0] = {"role": "user", "parts": [summary_part] + history[0]["parts"]}
+        else:
+            history.insert(0, {"role": "user", "parts": [summary_part]})
+    return history
@@ -0,0 +1,92 @@
+"""Answers trivial chat messages locally, without asking the model which tool to call."""
+import os
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from backend.rag.semantic_cache import lore_answer_cache
+from backend.services.dice_roller import DiceError, parse_dice
+from backend.services.single_flight import normalize_prompt
+
+# Set to "false" to send every chat message to the model
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+
+# The whole message must be a dice expression: "2d6+3", "roll 4d6kh3", "/roll d20+5 adv", "/r 3d6!"
+ROLL_PATTERN = re.compile(r"^\s*(?:/r(?:oll)?\s+|roll\s+(?:an?\s+)?)?(?P<expression>[^.]*?\d*d[\d%][^.]*?)\.?\s*$", re.IGNORECASE)
+# An explicit lore command: "/lore who rules the Sunken Spires?"
+LORE_COMMAND_PATTERN = re.compile(r"^\s*/lore\s+(?P<question>\S.*)$", re.IGNORECASE | re.DOTALL)
+
+
+@dataclass
+class Route:
+    """A tool call to make on the user's behalf, and the rule that chose it."""
+
+    rule: str
+    tool: str
+    args: Dict[str, Any] = field(default_factory=dict)
+
+
+class IntentRouter:
+    """
+    Deterministic matchers checked before a chat message is sent to the model.
+
+    Only messages that can mean one thing are routed: a bare dice roll, an explicit command,
+    or a lore question whose answer is already cached. Anything else returns None and goes
+    to the model as before.
+    """
+
+    def __init__(self, enabled: bool = FAST_PATH_ENABLED):
+        self.enabled = enabled
+        self.routed: Dict[str, int] = defaultdict(int)
+        self.to_model = 0
+        self.fallbacks = 0
+
+    def route(self, prompt: str) -> Optional[Route]:
+        """Returns the tool call that answers `prompt`, or None if the model should handle it."""
+        route = self._match(prompt) if self.enabled else None
+        if route is None:
+            self.to_model += 1
+        else:
+            self.routed[route.rule] += 1
+        return route
+
+    def _match(self, prompt: str) -> Optional[Route]:
+        roll = ROLL_PATTERN.match(prompt)
+        if roll:
+            try:
+                expression = parse_dice(roll.group("expression"))
+            except DiceError:
+                pass
+            else:
+                return Route("dice", "roll_dice", {"dice_string": expression.notation})
+
+        lore = LORE_COMMAND_PATTERN.match(prompt)
+        if lore:
+            return Route("lore_command", "ask_lore_keeper", {"prompt": lore.group("question").strip()})
+
+        if lore_answer_cache.has_question(normalize_prompt(prompt)):
+            return Route("lore_cached", "ask_lore_keeper", {"prompt": prompt.strip()})
+        return None
+
+    def fall_back(self, route: Route):
+        """Records that a routed tool call failed, so the message was sent to the model after all."""
+        self.routed[route.rule] -= 1
+        self.fallbacks += 1
+        self.to_model += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Reports how many messages each rule answered and how many went to the model."""
+        routed = sum(self.routed.values())
+        total = routed + self.to_model
+        return {
+            "enabled": self.enabled,
+            "routed": dict(self.routed),
+            "to_model": self.to_model,
+            "fallbacks": self.fallbacks,
+            "fast_path_rate": routed / total if total else 0.0,
+        }
+
+
+# Consulted by the chat agent before every model call
+intent_router = IntentRouter()
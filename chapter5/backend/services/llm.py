@@ -4,20 +4,59 @@ from dotenv import load_dotenv
 from google import genai
 from google.genai import types
 
+from backend.services.scheduler import OutboundScheduler, ScheduledAsyncClient
+
 # Load environment variables from .env file
 load_dotenv()
 
-# Use GOOGLE_API_KEY from environment variables
-api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    raise ValueError("GOOGLE_API_KEY not found in environment variables.")
+# Which backend serves LLM calls: "gemini" (default) or "fake", an in-process
+# stand-in with scripted tool calls and simulated latency for offline load tests
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
 
 # --- Client Instantiation ---
 # The client is the central object for all interactions with the Gemini API.
-client = genai.Client(api_key=api_key)
+if LLM_BACKEND == "fake":
+    from backend.services.fake_llm import FakeClient
+
+    client = FakeClient()
+elif LLM_BACKEND == "gemini":
+    # Use GOOGLE_API_KEY from environment variables
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY not found in environment variables.")
+    client = genai.Client(api_key=api_key)
+else:
+    raise ValueError(f"Unknown LLM_BACKEND {LLM_BACKEND!r}; use 'gemini' or 'fake'.")
+
+# Every async call goes through one shared scheduler (rate limits, adaptive
+# concurrency, backoff on 429/503, interactive before batch work)
+scheduler = OutboundScheduler()
+
+# The async interface of the same client. Awaiting it keeps the event loop free while
+# Gemini is thinking, so one worker can hold many in-flight calls.
+# See: https://googleapis.github.io/python-genai/#async
+aclient = ScheduledAsyncClient(client.aio, scheduler)
 
-# Default model for chat/tool use
+# Default models for chat/tool use and for embeddings. Under the fake backend the names
+# are namespaced, so fake answers and embeddings never share cache keys with real ones
 CHAT_MODEL = "gemini-2.5-flash"
+EMBEDDING_MODEL = "models/embedding-001"
+if LLM_BACKEND != "gemini":
+    CHAT_MODEL = f"{LLM_BACKEND}/{CHAT_MODEL}"
+    EMBEDDING_MODEL = f"{LLM_BACKEND}/{EMBEDDING_MODEL}"
+
+
+def backend_path(path: str) -> str:
+    """
+    The default location of a persistent file (cache, manifest, ...) for the selected backend.
+
+    Under the fake backend, "response_cache.db" becomes "response_cache.fake.db", so an offline
+    run never writes into the files the real backend reads.
+    """
+    if LLM_BACKEND == "gemini":
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.{LLM_BACKEND}{extension}"
 
 # --- Reusable Generation Configs ---
 
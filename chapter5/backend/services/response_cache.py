@@ -0,0 +1,210 @@
+"""A two-tier (memory + SQLite) cache for structured generation responses."""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from backend.services.llm import backend_path
+
+RESPONSE_CACHE_FILE = os.getenv("RESPONSE_CACHE_FILE", backend_path("response_cache.db"))
+# Number of responses kept in the in-memory tier
+RESPONSE_CACHE_MEMORY_ENTRIES = int(os.getenv("RESPONSE_CACHE_MEMORY_ENTRIES", "512"))
+# Upper bound on the total size of responses stored on disk
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+# Time-to-live per tool, in seconds (override with e.g. RESPONSE_CACHE_TTL_NPC=3600)
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+TOOL_TTL_SECONDS = {
+    "npc": int(os.getenv("RESPONSE_CACHE_TTL_NPC", str(DEFAULT_TTL_SECONDS))),
+    "encounter": int(os.getenv("RESPONSE_CACHE_TTL_ENCOUNTER", str(DEFAULT_TTL_SECONDS))),
+}
+
+
+def make_key(model: str, template: str, prompt: str) -> str:
+    """Content address of a generation: changing the model, the template or the prompt changes the key."""
+    payload = json.dumps([model, template, prompt.strip()], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Caches JSON-serialisable responses in an LRU dict in front of a SQLite table.
+
+    Entries expire after the TTL of their tool. The disk tier is trimmed to `max_bytes`
+    by dropping the least recently used entries.
+    """
+
+    def __init__(
+        self,
+        db_file: str = RESPONSE_CACHE_FILE,
+        memory_entries: int = RESPONSE_CACHE_MEMORY_ENTRIES,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+    ):
+        self.db_file = db_file
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        # key -> (tool, created_at, serialized value); values are parsed per hit so callers never share them
+        self._memory: "OrderedDict[str, Tuple[str, float, str]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    tool TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+            self._conn.commit()
+            self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        return self._conn
+
+    @staticmethod
+    def _is_expired(tool: str, created_at: float, now: float) -> bool:
+        return now - created_at > TOOL_TTL_SECONDS.get(tool, DEFAULT_TTL_SECONDS)
+
+    def get(self, tool: str, key: str) -> Optional[Any]:
+        """Returns the cached response, or None on a miss. Blocking: touches SQLite on a memory miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._is_expired(tool, entry[1], now):
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return json.loads(entry[2])
+                del self._memory[key]
+
+            conn = self._connection()
+            row = conn.execute("SELECT value, size, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, size, created_at = row
+            if self._is_expired(tool, created_at, now):
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                self._disk_bytes -= size
+                self.expired += 1
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.disk_hits += 1
+            self._remember(key, (tool, created_at, value))
+            return json.loads(value)
+
+    def put(self, tool: str, key: str, value: Any):
+        """Stores a response in both tiers. Blocking: writes to SQLite."""
+        now = time.time()
+        serialized = json.dumps(value, ensure_ascii=False)
+        size = len(serialized.encode("utf-8"))
+        with self._lock:
+            self._remember(key, (tool, now, serialized))
+            conn = self._connection()
+            old = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, tool, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, tool, serialized, size, now, now),
+            )
+            self._disk_bytes += size - (old[0] if old else 0)
+            self._trim_disk(conn)
+            conn.commit()
+
+    def _remember(self, key: str, entry: Tuple[str, float, str]):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _trim_disk(self, conn: sqlite3.Connection):
+        while self._disk_bytes > self.max_bytes:
+            rows = conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC LIMIT 64").fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                break
+            for key, size in rows:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._memory.pop(key, None)
+                self._disk_bytes -= size
+                self.evictions += 1
+                if self._disk_bytes <= self.max_bytes:
+                    break
+
+    async def get_or_compute(
+        self,
+        tool: str,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        fresh: bool = False,
+        cacheable: Callable[[Any], bool] = lambda value: True,
+    ) -> Any:
+        """
+        Returns the cached response for `key`, or awaits `compute()` and caches its result.
+
+        Args:
+            tool: Name of the tool, which selects the TTL.
+            key: Content address from `make_key`.
+            compute: Produces the response on a miss.
+            fresh: Skip the lookup (the new response still replaces the cached one).
+            cacheable: Decides whether a computed response may be stored (e.g. not errors).
+        """
+        if fresh:
+            self.bypassed += 1
+        else:
+            cached = await asyncio.to_thread(self.get, tool, key)
+            if cached is not None:
+                return cached
+        value = await compute()
+        if cacheable(value):
+            await asyncio.to_thread(self.put, tool, key, value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        """Reports hit rates per tier and the size of the cache."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+            "disk_bytes": self._disk_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def close(self):
+        """Closes the SQLite connection of the disk tier."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Shared by the REST endpoints, the chat agent's tools and the MCP tools
+response_cache = ResponseCache()
@@ -0,0 +1,316 @@
+"""A shared outbound scheduler for LLM calls: rate limits, adaptive concurrency and priorities."""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import time
+from contextlib import asynccontextmanager, contextmanager
+from enum import IntEnum
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Requests per minute allowed per model (token-bucket refill rate)
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "600"))
+# Requests that may be sent at once in a burst
+LLM_BURST = int(os.getenv("LLM_BURST", "20"))
+# Bounds of the adaptive concurrency limit
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+# Retries of a throttled (429/503) call before giving up
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+
+# HTTP status codes that mean "slow down" rather than "this request is wrong"
+THROTTLE_CODES = (429, 503)
+
+
+class Priority(IntEnum):
+    """Lower values are served first."""
+
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+# The priority of LLM calls made by the current task; interactive unless marked otherwise
+llm_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar("llm_priority", default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def batch_priority() -> Iterator[None]:
+    """Marks LLM calls made inside the block (and by tasks it creates) as batch work."""
+    token = llm_priority.set(Priority.BATCH)
+    try:
+        yield
+    finally:
+        llm_priority.reset(token)
+
+
+def is_throttled(error: BaseException) -> bool:
+    """True for quota and overload errors (429/503) from the GenAI SDK."""
+    return getattr(error, "code", None) in THROTTLE_CODES
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, holding at most `capacity`.
+
+    When callers have to wait, tokens are handed out by priority (then arrival), so an
+    interactive call never queues behind batch calls that asked for a token earlier.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _dispatch(self):
+        """Hands available tokens to the best waiters and schedules a wake-up for the rest."""
+        self._timer = None
+        self._refill()
+        while self._waiters and self.tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.tokens -= 1
+                future.set_result(None)
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        if self._waiters:
+            self._timer = asyncio.get_running_loop().call_later((1 - self.tokens) / self.rate, self._dispatch)
+
+    async def acquire(self, priority: int = 0):
+        self._refill()
+        if not self._waiters and self.tokens >= 1:
+            self.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._timer is None:
+            self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The token was granted just as we were cancelled; give it back
+                self.tokens += 1
+                if self._timer is None:
+                    self._dispatch()
+            raise
+
+
+class OutboundScheduler:
+    """
+    Gates every outbound LLM call.
+
+    A call first waits for a token from its model's bucket, then for a concurrency slot;
+    at both steps interactive callers are served before batch callers. The concurrency limit adapts AIMD-style:
+    it grows by about one per limit's worth of successful calls and halves when the API
+    answers 429/503, and throttled calls are retried with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+        burst: int = LLM_BURST,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        min_concurrency: int = LLM_MIN_CONCURRENCY,
+        max_retries: int = LLM_MAX_RETRIES,
+    ):
+        self.rate = requests_per_minute / 60
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self.calls = 0
+        self.throttled = 0
+        self.retries = 0
+        self.failures = 0
+        self._wait_totals: Dict[str, float] = {p.name.lower(): 0.0 for p in Priority}
+        self._wait_counts: Dict[str, int] = {p.name.lower(): 0 for p in Priority}
+        self._wait_max: Dict[str, float] = {p.name.lower(): 0.0 for p in Priority}
+
+    def _bucket(self, model: str) -> TokenBucket:
+        if model not in self._buckets:
+            self._buckets[model] = TokenBucket(self.rate, self.burst)
+        return self._buckets[model]
+
+    def _wake_waiters(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, model: str) -> AsyncIterator[None]:
+        """Takes one rate-limit token, then holds one concurrency slot for the duration of the block."""
+        priority = llm_priority.get()
+        started = time.monotonic()
+        # The token comes first: a slot held while waiting for the rate limit would block
+        # higher-priority calls that could otherwise be next in line
+        await self._bucket(model).acquire(priority)
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was granted just as we were cancelled; hand it on
+                    self.in_flight -= 1
+                    self._wake_waiters()
+                raise
+        try:
+            self._record_wait(priority, time.monotonic() - started)
+            yield
+        finally:
+            self.in_flight -= 1
+            self._wake_waiters()
+
+    def _record_wait(self, priority: Priority, waited: float):
+        name = priority.name.lower()
+        self._wait_totals[name] += waited
+        self._wait_counts[name] += 1
+        self._wait_max[name] = max(self._wait_max[name], waited)
+
+    def _on_success(self):
+        self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+        self._wake_waiters()
+
+    def _on_throttle(self):
+        self.throttled += 1
+        self.limit = max(self.min_concurrency, self.limit / 2)
+
+    async def _handle_failure(self, error: BaseException, attempt: int):
+        """Re-raises errors that must not be retried; otherwise backs off before the next attempt."""
+        if not isinstance(error, Exception):
+            raise error
+        if not is_throttled(error):
+            self.failures += 1
+            raise error
+        self._on_throttle()
+        if attempt == self.max_retries:
+            self.failures += 1
+            raise error
+        self.retries += 1
+        delay = LLM_BACKOFF_BASE_SECONDS * 2 ** attempt
+        await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+    async def run(self, model: str, call: Callable[[], Awaitable[T]]) -> T:
+        """Awaits `call()` under the scheduler, retrying on 429/503 with backoff."""
+        self.calls += 1
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(model):
+                    result = await call()
+            except BaseException as e:
+                await self._handle_failure(e, attempt)
+                attempt += 1
+            else:
+                self._on_success()
+                return result
+
+    async def stream(self, model: str, open_stream: Callable[[], Awaitable[AsyncIterator[T]]]) -> AsyncIterator[T]:
+        """
+        Opens a streamed call under the scheduler and returns its chunks.
+
+        The SDK only sends the request when the stream is first iterated, so the first chunk
+        is read here: a 429/503 raised before any chunk has been produced is retried like any
+        other call. The slot stays taken until the whole response has been read.
+        """
+        self.calls += 1
+        attempt = 0
+        while True:
+            slot = self.slot(model)
+            await slot.__aenter__()
+            try:
+                stream = await open_stream()
+                try:
+                    first: Optional[T] = await stream.__anext__()
+                    empty = False
+                except StopAsyncIteration:
+                    first, empty = None, True
+            except BaseException as e:
+                await slot.__aexit__(type(e), e, e.__traceback__)
+                await self._handle_failure(e, attempt)
+                attempt += 1
+            else:
+                break
+
+        async def chunks() -> AsyncIterator[T]:
+            try:
+                if not empty:
+                    yield first
+                    async for chunk in stream:
+                        yield chunk
+                self._on_success()
+            finally:
+                await slot.__aexit__(None, None, None)
+
+        return chunks()
+
+    def stats(self) -> Dict[str, Any]:
+        """Reports queue depth, wait times and the current adaptive limit."""
+        queued = {p.name.lower(): 0 for p in Priority}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                queued[Priority(priority).name.lower()] += 1
+        return {
+            "concurrency_limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": queued,
+            "wait_seconds": {
+                name: {
+                    "mean": self._wait_totals[name] / count if count else 0.0,
+                    "max": self._wait_max[name],
+                }
+                for name, count in self._wait_counts.items()
+            },
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "failures": self.failures,
+        }
+
+
+class ScheduledAsyncModels:
+    """Wraps `client.aio.models` so that every call goes through the scheduler."""
+
+    def __init__(self, models: Any, scheduler: OutboundScheduler):
+        self._models = models
+        self._scheduler = scheduler
+
+    async def generate_content(self, *, model: str, **kwargs: Any) -> Any:
+        return await self._scheduler.run(model, lambda: self._models.generate_content(model=model, **kwargs))
+
+    async def embed_content(self, *, model: str, **kwargs: Any) -> Any:
+        return await self._scheduler.run(model, lambda: self._models.embed_content(model=model, **kwargs))
+
+    async def generate_content_stream(self, *, model: str, **kwargs: Any) -> AsyncIterator[Any]:
+        return await self._scheduler.stream(model, lambda: self._models.generate_content_stream(model=model, **kwargs))
+
+
+class ScheduledAsyncClient:
+    """Stands in for `client.aio`, routing calls through an `OutboundScheduler`."""
+
+    def __init__(self, async_client: Any, scheduler: OutboundScheduler):
+        self.models = ScheduledAsyncModels(async_client.models, scheduler)
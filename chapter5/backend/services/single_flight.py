@@ -0,0 +1,55 @@
+"""Coalesces identical concurrent tool calls into a single in-flight request."""
+import asyncio
+import copy
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalises a prompt so that trivially different spellings share one request."""
+    return " ".join(prompt.casefold().split())
+
+
+class SingleFlight:
+    """
+    Shares one in-flight call between concurrent callers with the same (name, key).
+
+    The first caller starts the work; callers arriving before it finishes await the same
+    task and each get their own copy of the result (or the same exception). The shared
+    task is shielded, so one caller disconnecting does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.coalesced: Dict[str, int] = defaultdict(int)
+
+    async def run(self, name: str, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """Awaits `func()`, or the identical call already in flight."""
+        self.calls[name] += 1
+        flight_key = (name, key)
+        task = self._inflight.get(flight_key)
+        if task is not None:
+            self.coalesced[name] += 1
+            return copy.deepcopy(await asyncio.shield(task))
+
+        task = asyncio.ensure_future(func())
+        self._inflight[flight_key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(flight_key, None))
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        """Reports, per tool, how many calls were made and how many were served by another call."""
+        return {
+            "in_flight": len(self._inflight),
+            "tools": {
+                name: {"calls": calls, "coalesced": self.coalesced[name]}
+                for name, calls in self.calls.items()
+            },
+        }
+
+
+# Shared by the REST endpoints, the MCP tools and the /chat tool dispatcher
+single_flight = SingleFlight()
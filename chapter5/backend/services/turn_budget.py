@@ -0,0 +1,103 @@
+"""Execution budget of one chat turn: model iterations, a wall-clock deadline and per-tool timeouts."""
+import os
+import time
+from typing import Any, Dict, Optional
+
+# Maximum number of model calls in one turn, including the forced final answer
+AGENT_MAX_ITERATIONS = int(os.getenv("AGENT_MAX_ITERATIONS", "6"))
+# Wall-clock limit of a whole turn, including every model call and the final answer
+AGENT_TURN_DEADLINE_SECONDS = float(os.getenv("AGENT_TURN_DEADLINE_SECONDS", "90"))
+# Time kept back for the final answer: tool iterations stop this long before the deadline
+# (at most a third of the deadline, so short deadlines still leave room for tools)
+AGENT_FINAL_ANSWER_RESERVE_SECONDS = float(os.getenv("AGENT_FINAL_ANSWER_RESERVE_SECONDS", "15"))
+# Default wall-clock limit for a single tool call
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "60"))
+# Per-tool limits (override with e.g. TOOL_TIMEOUT_ROLL_DICE=2)
+TOOL_TIMEOUTS = {
+    name: float(os.getenv(f"TOOL_TIMEOUT_{name.upper()}", str(default)))
+    for name, default in {
+        "roll_dice": 5,
+        "roll_dice_many": 5,
+        "dice_distribution": 5,
+        "ask_lore_keeper": 30,
+        "generate_npc": TOOL_TIMEOUT_SECONDS,
+        "generate_encounter": TOOL_TIMEOUT_SECONDS,
+    }.items()
+}
+# A tool is never given less than this, even close to the deadline
+MIN_TOOL_TIMEOUT_SECONDS = 1.0
+
+
+class TurnBudget:
+    """
+    Tracks what one turn of the agent loop has used.
+
+    The loop asks `must_finish()` before each model call; once the iteration cap is reached or
+    only the final-answer reserve is left, the next call is made with tools disabled so the
+    model has to answer. Every model call is limited to `model_timeout()`, so the turn as a
+    whole never runs past its deadline.
+    """
+
+    def __init__(
+        self,
+        max_iterations: int = AGENT_MAX_ITERATIONS,
+        deadline_seconds: float = AGENT_TURN_DEADLINE_SECONDS,
+    ):
+        self.max_iterations = max(1, max_iterations)
+        self.deadline_seconds = deadline_seconds
+        self.final_reserve = min(AGENT_FINAL_ANSWER_RESERVE_SECONDS, deadline_seconds / 3)
+        self.started = time.monotonic()
+        self.iterations = 0
+        self.tool_calls = 0
+        self.tool_timeouts = 0
+        self.tool_errors = 0
+        self.model_timeouts = 0
+        self.forced_final: Optional[str] = None
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline_seconds - self.elapsed())
+
+    def remaining_for_tools(self) -> float:
+        """Time left before the final-answer reserve."""
+        return max(0.0, self.remaining() - self.final_reserve)
+
+    def must_finish(self) -> bool:
+        """True if the next model call has to be the final answer; records why the first time."""
+        if self.forced_final is None:
+            if self.iterations + 1 >= self.max_iterations:
+                self.forced_final = "max_iterations"
+            elif self.remaining_for_tools() <= 0:
+                self.forced_final = "deadline"
+        return self.forced_final is not None
+
+    def model_timeout(self, final: bool) -> float:
+        """The time limit of a model call: the rest of the turn for the final answer, less the reserve otherwise."""
+        return self.remaining() if final else self.remaining_for_tools()
+
+    def model_timed_out(self):
+        """Records a model call cut off by the deadline; the next call has to be the final answer."""
+        self.model_timeouts += 1
+        if self.forced_final is None:
+            self.forced_final = "deadline"
+
+    def tool_timeout(self, name: str) -> float:
+        """The time limit of a call to `name`: its own limit, cut short before the final-answer reserve."""
+        limit = TOOL_TIMEOUTS.get(name, TOOL_TIMEOUT_SECONDS)
+        return max(MIN_TOOL_TIMEOUT_SECONDS, min(limit, self.remaining_for_tools()))
+
+    def usage(self) -> Dict[str, Any]:
+        """What the turn used, stored with the final answer so the limits can be tuned."""
+        return {
+            "iterations": self.iterations,
+            "max_iterations": self.max_iterations,
+            "elapsed_seconds": round(self.elapsed(), 3),
+            "deadline_seconds": self.deadline_seconds,
+            "tool_calls": self.tool_calls,
+            "tool_timeouts": self.tool_timeouts,
+            "tool_errors": self.tool_errors,
+            "model_timeouts": self.model_timeouts,
+            "forced_final": self.forced_final,
+        }
@@ -55,20 +55,47 @@ def display_chat_history():
 # Display existing chat history
 display_chat_history()
 
+# Function to read Server-Sent Events from the streaming chat endpoint
+def stream_chat_events(prompt):
+    with requests.post(
+        f"{FASTAPI_URL}/chat/stream",
+        json={"prompt": prompt, "thread_id": st.session_state.thread_id},
+        stream=True,
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if line and line.startswith("data: "):
+                yield json.loads(line[len("data: "):])
+
 # React to user input
 if prompt := st.chat_input("What do you need help with?"):
     # Display the new user message immediately
     with st.chat_message("user"):
         st.markdown(prompt)
-    
-    # Send the prompt to the backend and get the full history
-    with st.spinner('Thinking...'):
+
+    # Stream the answer: render tokens and tool activity as they arrive
+    with st.chat_message("assistant"):
         try:
-            requests.post(
-                f"{FASTAPI_URL}/chat",
-                json={"prompt": prompt, "thread_id": st.session_state.thread_id},
-            )
-            # After sending, we can just re-display the whole history
+            text = ""
+            placeholder = st.empty()
+            for event in stream_chat_events(prompt):
+                if event["type"] == "text":
+                    text += event["text"]
+                    placeholder.markdown(text)
+                elif event["type"] == "reset":
+                    # The server dropped the text streamed so far (a model call that ran out of time)
+                    text = ""
+                    placeholder.markdown(text)
+                elif event["type"] == "tool_call":
+                    st.info(f"Calling tool: {event['name']}({json.dumps(event['args'])})")
+                    # Text after the tool results goes below them
+                    text = ""
+                    placeholder = st.empty()
+                elif event["type"] == "tool_result":
+                    st.info(f"Tool response from {event['name']}: {event['response']}")
+                elif event["type"] == "error":
+                    st.error(f"The assistant ran into a problem: {event['message']}")
+            # The turn is persisted; re-display the whole history
             st.rerun()
 
         except requests.exceptions.RequestException as e:
@@ -1,58 +1,34 @@
-"""This script sets up the Chroma DB with the sample text."""
-import chromadb
-from google import genai
+"""This script sets up the Chroma DB with the lore corpus."""
+import asyncio
 import os
+import sys
 
-from backend.services.llm import client
+from backend.rag.ingest import ingest_corpus
+from backend.rag.vector_store import get_collection
+from backend.services.llm import EMBEDDING_MODEL
 
+# A single text file, or a directory of .txt/.md files (sourcebooks, session notes, ...)
+LORE_CORPUS = os.getenv("LORE_CORPUS", "sample.txt")
 
-def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> list[str]:
-    """Splits text into overlapping chunks."""
-    if chunk_size <= overlap:
-        raise ValueError("chunk_size must be greater than overlap")
 
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunks.append(text[start:end])
-        start += chunk_size - overlap
-    return chunks
-
-def setup_rag():
-    """Sets up the RAG chain by creating and populating a Chroma DB."""
+def setup_rag(corpus: str = LORE_CORPUS):
+    """Sets up the RAG chain by syncing the lore corpus into a Chroma DB collection."""
     try:
-        # Connect to the Chroma DB service
-        db_client = chromadb.HttpClient(host="chroma", port=8000)
-
-        # Create an embedding function
-        embedding_model = "models/embedding-001"
-
-        # Get or create the collection
-        collection = db_client.get_or_create_collection(name="dnd_lore")
+        # Connect to Chroma (the Chroma DB service, or a local one under LLM_BACKEND=fake)
+        # and get or create the collection
+        collection = get_collection()
 
-        # Load the sample text
-        with open("sample.txt", "r", encoding="utf-8") as f:
-            sample_text = f.read()
+        # Stream the corpus into the collection. Only new or changed chunks are embedded and
+        # written, chunks that disappeared are removed, and an interrupted run resumes on restart
+        counts = asyncio.run(ingest_corpus(collection, EMBEDDING_MODEL, corpus))
 
-        # Split the text into chunks without LangGraph
-        chunks = chunk_text(sample_text)
-
-        # Add the chunks to the collection
-        response = client.models.embed_content(
-            model=embedding_model,
-            contents=chunks,
-        )
-        collection.add(
-            embeddings=[embedding.values for embedding in response.embeddings],
-            documents=chunks,
-            ids=[f"chunk_{i}" for i, _ in enumerate(chunks)],
+        print(
+            f"Successfully set up the Chroma DB: {counts['added']} added, "
+            f"{counts['deleted']} deleted, {counts['unchanged']} unchanged."
         )
 
-        print("Successfully set up the Chroma DB.")
-
     except Exception as e:
         print(f"An error occurred during RAG setup: {e}")
 
 if __name__ == "__main__":
-    setup_rag()
+    setup_rag(sys.argv[1] if len(sys.argv) > 1 else LORE_CORPUS)